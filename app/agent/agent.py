@@ -180,7 +180,14 @@ class AnswerGenerator:
         final_keyframes: List[KeyframeServiceReponse],
         objects_data: Dict[str, List[str]],
         asr_data: Dict[str, dict | str],
+        asr_segments: Dict[int, str] | None = None,
     ):
+        """
+        `asr_segments` maps keyframe id -> the transcript segment spoken around
+        it; keyframes without one fall back to the start of the video's ASR.
+        """
+        asr_segments = asr_segments or {}
+        segment_owner: Dict[str, int] = {}  # đoạn ASR -> keyframe đầu tiên dùng nó
         chat_messages = []
         for kf in final_keyframes:
             keyy = f"{kf.prefix}{kf.group_num:02d}/{kf.prefix}{kf.group_num:02d}_V{kf.video_num:03d}/{kf.keyframe_num:03d}.jpg"
@@ -191,16 +198,27 @@ class AnswerGenerator:
                 f"{kf.prefix}{kf.group_num:02d}/{kf.prefix}{kf.group_num:02d}_V{kf.video_num:03d}/{kf.keyframe_num:03d}.jpg",
             )
 
-            # Lấy ASR theo video
-            vkey = f"{kf.prefix}{kf.group_num:02d}_V{kf.video_num:03d}.mp4"
-            asr_rec = asr_data.get(vkey, {})
-            if isinstance(asr_rec, dict):
-                asr_text = (
-                    asr_rec.get("asr_clean") or asr_rec.get("asr_raw") or ""
-                ).strip()
+            segment = asr_segments.get(kf.key)
+            if segment is not None:
+                # nhiều keyframe gần nhau thường rơi vào cùng một đoạn: chỉ gửi 1 lần
+                if segment in segment_owner:
+                    asr_snippet = f"(same as Keyframe {segment_owner[segment]})"
+                else:
+                    segment_owner[segment] = kf.key
+                    asr_snippet = segment
             else:
-                asr_text = str(asr_rec).strip() if asr_rec else ""
-            asr_snippet = (asr_text[:400] + "…") if len(asr_text) > 400 else asr_text
+                # Lấy ASR theo video
+                vkey = f"{kf.prefix}{kf.group_num:02d}_V{kf.video_num:03d}.mp4"
+                asr_rec = asr_data.get(vkey, {})
+                if isinstance(asr_rec, dict):
+                    asr_text = (
+                        asr_rec.get("asr_clean") or asr_rec.get("asr_raw") or ""
+                    ).strip()
+                else:
+                    asr_text = str(asr_rec).strip() if asr_rec else ""
+                asr_snippet = (
+                    (asr_text[:400] + "…") if len(asr_text) > 400 else asr_text
+                )
 
             context_text = f"""
             Keyframe {kf.key} from Video {kf.video_num} (Confidence: {kf.confidence_score:.3f}):
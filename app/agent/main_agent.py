@@ -13,34 +13,51 @@ from .agent import VisualEventExtractor, AnswerGenerator
 from service.search_service import KeyframeQueryService
 from service.model_service import ModelService
 from schema.response import KeyframeServiceReponse
+from utils.asr_embeddings import AsrChunkIndex, AsrEmbeddingIndex, asr_text_of
+from utils.frame_index import video_code
+from utils.detection_store import DetectionStore
+from utils.object_index import ObjectIndex, detection_key
+from utils.id_range_index import IdRangeIndex
+from core.logger import SimpleLogger
+
+logger = SimpleLogger(__name__)
 
 
 def apply_object_filter(
     keyframes: List[KeyframeServiceReponse],
-    objects_data: dict[str, list[str]],
+    objects_data: dict[str, list[str]] | DetectionStore,
     target_objects: List[str],
+    object_index: ObjectIndex | None = None,
 ) -> List[KeyframeServiceReponse]:
 
     if not target_objects:
         return keyframes
 
+    if object_index is not None:
+        mask = object_index.contains_any((kf.key for kf in keyframes), target_objects)
+        return [kf for kf, keep in zip(keyframes, mask.tolist()) if keep]
+
     target_objects_set = {obj.lower() for obj in target_objects}
     filtered_keyframes = []
 
     for kf in keyframes:
-        keyy = f"{kf.prefix}{kf.group_num:02d}/{kf.prefix}{kf.group_num:02d}_V{kf.video_num:03d}/{kf.keyframe_num:03d}.jpg"
+        keyy = detection_key(kf.prefix, kf.group_num, kf.video_num, kf.keyframe_num)
         keyframe_objects = objects_data.get(keyy, [])
-        print(f"{keyy=}")
-        print(f"{keyframe_objects=}")
         keyframe_objects_set = {obj.lower() for obj in keyframe_objects}
 
         if target_objects_set.intersection(keyframe_objects_set):
             filtered_keyframes.append(kf)
 
-    print(f"{filtered_keyframes=}")
     return filtered_keyframes
 
 
+def _mmss(seconds: float) -> str:
+    if not np.isfinite(seconds):
+        return "?"
+    minutes, secs = divmod(int(seconds), 60)
+    return f"{minutes:02d}:{secs:02d}"
+
+
 class KeyframeSearchAgent:
     def __init__(
         self,
@@ -48,9 +65,13 @@ class KeyframeSearchAgent:
         keyframe_service: KeyframeQueryService,
         model_service: ModelService,
         data_folder: str,
-        objects_data: dict[str, list[str]],
+        objects_data: dict[str, list[str]] | DetectionStore,
         asr_data: dict[str, str | dict],
         top_k: int = 10,
+        asr_embeddings: AsrEmbeddingIndex | None = None,
+        asr_chunks: AsrChunkIndex | None = None,
+        object_index: ObjectIndex | None = None,
+        id_ranges: IdRangeIndex | None = None,
     ):
         self.llm = llm
         self.keyframe_service = keyframe_service
@@ -60,10 +81,30 @@ class KeyframeSearchAgent:
 
         self.objects_data = objects_data or {}
         self.asr_data = asr_data or {}
+        self.asr_embeddings = asr_embeddings
+        self.asr_chunks = asr_chunks
+        self.object_index = object_index
+        # khoảng id của từng video, để thu hẹp filter object vào video ứng viên
+        self.id_ranges = id_ranges
 
         self.query_extractor = VisualEventExtractor(llm)
         self.answer_generator = AnswerGenerator(llm, data_folder)
 
+    def update_data(
+        self,
+        objects_data: dict[str, list[str]] | DetectionStore,
+        asr_data: dict[str, str | dict],
+        asr_embeddings: AsrEmbeddingIndex | None = None,
+        asr_chunks: AsrChunkIndex | None = None,
+        object_index: ObjectIndex | None = None,
+    ):
+        """Replace the shared stores; the old dicts are never mutated in place"""
+        self.objects_data = objects_data or {}
+        self.asr_data = asr_data or {}
+        self.asr_embeddings = asr_embeddings
+        self.asr_chunks = asr_chunks
+        self.object_index = object_index
+
     async def process_query1(self, user_query: str) -> str:
         """
         Main agent flow:
@@ -81,7 +122,7 @@ class KeyframeSearchAgent:
         print(f"{search_query=}")
         print(f"{suggested_objects=}")
 
-        embedding = self.model_service.embedding(search_query).tolist()[0]
+        embedding = (await self.model_service.aembedding(search_query)).tolist()[0]
         top_k_keyframes = await self.keyframe_service.search_by_text(
             text_embedding=embedding, top_k=self.top_k, score_threshold=0.1
         )
@@ -125,16 +166,31 @@ class KeyframeSearchAgent:
         return cast(str, answer)
 
     async def process_query(self, user_query: str) -> str:
+        # Giữ tham chiếu cố định trong suốt request (reload có thể thay store)
+        objects_data = self.objects_data
+        asr_data = self.asr_data
+        asr_embeddings = self.asr_embeddings
+        asr_chunks = self.asr_chunks
+        object_index = self.object_index
+
         agent_response = await self.query_extractor.extract_visual_events(user_query)
         search_query = agent_response.refined_query
         suggested_objects = agent_response.list_of_objects
 
         # Embed 1 lần cho query dùng lại
-        q_emb = self.model_service.embedding(search_query).tolist()[0]
-
-        top_k_keyframes = await self.keyframe_service.search_by_text(
-            text_embedding=q_emb, top_k=self.top_k, score_threshold=0.1
-        )
+        q_emb = (await self.model_service.aembedding(search_query)).tolist()[0]
+
+        # Đẩy ràng buộc object vào filter của Milvus: mọi ứng viên đều có object
+        top_k_keyframes = []
+        objects_prefiltered = False
+        if suggested_objects and object_index is not None:
+            top_k_keyframes, objects_prefiltered = await self._search_with_objects(
+                q_emb, suggested_objects, object_index
+            )
+        if not top_k_keyframes:
+            top_k_keyframes = await self.keyframe_service.search_by_text(
+                text_embedding=q_emb, top_k=self.top_k, score_threshold=0.1
+            )
 
         # Tính điểm theo VIDEO (visual_avg) như cũ
         video_scores = self.query_extractor.calculate_video_scores(top_k_keyframes)
@@ -146,18 +202,12 @@ class KeyframeSearchAgent:
         best_final = -1.0
 
         # Đánh giá top 10 video đầu tiên đủ rồi (tối ưu tốc độ)
-        for vis_avg, kfs in video_scores[:TOP_VIDEOS]:
-            p = kfs[0].prefix
-            g = kfs[0].group_num
-            v = kfs[0].video_num
-            asr_text = self._get_asr_text_for_video(p, g, v)[:2000]
-
-            asr_sim = 0.0
-            if asr_text:
-                # Cắt gọn để tránh tokenizer CLIP truncate quá dài
-                asr_emb = self.model_service.embedding(asr_text).tolist()[0]
-                asr_sim = self._cosine(np.array(q_emb), np.array(asr_emb))
+        candidates = video_scores[:TOP_VIDEOS]
+        asr_sims = await self._asr_similarities(
+            np.asarray(q_emb, dtype=np.float32), candidates, asr_data, asr_embeddings
+        )
 
+        for (vis_avg, kfs), asr_sim in zip(candidates, asr_sims.tolist()):
             final_score = alpha * vis_avg + (1 - alpha) * asr_sim
             if final_score > best_final:
                 best_final = final_score
@@ -165,12 +215,13 @@ class KeyframeSearchAgent:
 
         final_keyframes = best_video_keyframes or video_scores[0][1]
 
-        # Lọc theo COCO object nếu agent gợi ý
-        if suggested_objects:
+        # Lọc theo COCO object nếu agent gợi ý (chưa lọc sẵn trong lúc search)
+        if suggested_objects and not objects_prefiltered:
             filtered_keyframes = apply_object_filter(
                 keyframes=final_keyframes,
-                objects_data=self.objects_data,
+                objects_data=objects_data,
                 target_objects=suggested_objects,
+                object_index=object_index,
             )
             if filtered_keyframes:
                 final_keyframes = filtered_keyframes
@@ -178,27 +229,118 @@ class KeyframeSearchAgent:
         answer = await self.answer_generator.generate_answer(
             original_query=user_query,
             final_keyframes=final_keyframes,
-            objects_data=self.objects_data,
-            asr_data=self.asr_data,  # <-- TRUYỀN ASR VÀO PROMPT
+            objects_data=objects_data,
+            asr_data=asr_data,  # <-- TRUYỀN ASR VÀO PROMPT
+            asr_segments=self._asr_segments(q_emb, final_keyframes, asr_chunks),
         )
 
         return cast(str, answer)
 
-    def _cosine(self, a: np.ndarray, b: np.ndarray) -> float:
-        a = a / (np.linalg.norm(a) + 1e-8)
-        b = b / (np.linalg.norm(b) + 1e-8)
-        return float(np.dot(a, b))
-
-    def _get_asr_text_for_video(
-        self, prefix: str, group_num: int, video_num: int
-    ) -> str:
-        key_mp4 = f"{prefix}{group_num:02d}_V{video_num:03d}.mp4"
-        rec = self.asr_data.get(key_mp4, None)
-        if isinstance(rec, dict):
-            return (rec.get("asr_clean") or rec.get("asr_raw") or "").strip()
-        elif isinstance(rec, str):
-            return rec.strip()
-        return ""
+    async def _search_with_objects(
+        self,
+        q_emb: list[float],
+        objects: list[str],
+        object_index: ObjectIndex,
+    ) -> tuple[list[KeyframeServiceReponse], bool]:
+        """
+        (keyframes, whether they all contain one of `objects`). A common class
+        gives too long a filter over the whole corpus; it is then restricted
+        to the candidate videos of a plain search, halving them until it fits.
+        """
+        plain: list[KeyframeServiceReponse] = []
+        expr = object_index.filter_expr(objects)
+        if (
+            expr is None
+            and self.id_ranges is not None
+            and len(object_index.ids_for(objects))
+        ):
+            plain = await self.keyframe_service.search_by_text(
+                text_embedding=q_emb, top_k=self.top_k, score_threshold=0.1
+            )
+            video_ranges = []
+            for _, kfs in self.query_extractor.calculate_video_scores(plain):
+                kf = kfs[0]
+                video_range = self.id_ranges.range_of(kf.group_num, kf.video_num, kf.key)
+                if video_range is not None:
+                    video_ranges.append(video_range)
+            n = len(video_ranges)
+            while expr is None and n > 0:
+                expr = object_index.filter_expr(objects, within=video_ranges[:n])
+                if expr is None:
+                    n //= 2
+            if expr is not None:
+                logger.info(
+                    f"Object filter {objects} restricted to the top {n} candidate videos"
+                )
+
+        if expr is None:
+            logger.warning(
+                f"No usable object filter for {objects}; filtering the top-k results instead"
+            )
+            return plain, False
+
+        keyframes = await self.keyframe_service.search_by_text_filter(
+            text_embedding=q_emb,
+            top_k=self.top_k,
+            score_threshold=0.1,
+            filter_expr=expr,
+        )
+        if keyframes:
+            return keyframes, True
+        return plain, False
+
+    @staticmethod
+    def _asr_segments(
+        q_emb: list[float],
+        keyframes: list[KeyframeServiceReponse],
+        asr_chunks: AsrChunkIndex | None,
+    ) -> dict[int, str]:
+        """Keyframe id -> '[mm:ss-mm:ss] text' of the best ASR chunk around it"""
+        if asr_chunks is None or not keyframes:
+            return {}
+        segments = asr_chunks.best_segments(
+            [kf.key for kf in keyframes], np.asarray(q_emb, dtype=np.float32)
+        )
+        return {
+            kf.key: f"[{_mmss(seg.start)}-{_mmss(seg.end)}] {seg.text}"
+            for kf, seg in zip(keyframes, segments)
+            if seg is not None
+        }
+
+    async def _asr_similarities(
+        self,
+        q_emb: np.ndarray,
+        candidates: list[tuple[float, list[KeyframeServiceReponse]]],
+        asr_data: dict[str, str | dict],
+        asr_embeddings: AsrEmbeddingIndex | None,
+    ) -> np.ndarray:
+        """
+        ASR similarity of each candidate video: one matvec against the
+        precomputed ASR matrix; videos missing from it are embedded on the fly
+        (truncated, in one batch) as before.
+        """
+        codes = [
+            video_code(kfs[0].prefix, kfs[0].group_num, kfs[0].video_num)
+            for _, kfs in candidates
+        ]
+        sims = np.zeros(len(candidates), dtype=np.float32)
+        found = np.zeros(len(candidates), dtype=bool)
+        if asr_embeddings is not None:
+            sims, found = asr_embeddings.similarities(q_emb, codes)
+
+        # Cắt gọn để tránh tokenizer CLIP truncate quá dài
+        missing = {
+            i: asr_text_of(asr_data.get(f"{codes[i]}.mp4"))[:2000]
+            for i in np.flatnonzero(~found).tolist()
+        }
+        missing = {i: text for i, text in missing.items() if text}
+        if missing:
+            asr_embs = await self.model_service.aembedding_many(
+                list(missing.values()), use_cache=False
+            )
+            q = q_emb / (np.linalg.norm(q_emb) + 1e-8)
+            sims[list(missing)] = asr_embs @ q
+        return sims
 
     # def _get_ocr_texts_for_video(self, g: int, v: int, kfs: list) -> list[str]:
     #     """
@@ -0,0 +1,233 @@
+"""
+Offline batch runner: JSONL query file -> one submission CSV per query, without
+the HTTP server.
+
+    python app/batch_search.py --queries queries.jsonl --output_dir submission/
+
+Each line is a JSON object with an id ("query_id", "id" or "request_id"), the
+text ("query", "text" or "body") and optionally top_k, score_threshold,
+include_groups, include_videos, exclude_groups. Output rows are
+"<video_name>,<frame_idx>" like the /keyframe/search export.
+
+Queries whose CSV already exists are skipped, so a crashed run can simply be
+started again with the same arguments.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import argparse
+import asyncio
+import hashlib
+import json
+import re
+import time
+from itertools import islice
+from pathlib import Path
+from typing import Iterator
+
+from pydantic import ValidationError
+
+from core.settings import MongoDBSettings, KeyFrameIndexMilvusSetting, AppSettings
+from core.lifespan import (
+    _connect_mongo,
+    _build_keyframe_store,
+    _build_service_factory,
+    _build_query_controller,
+)
+from controller.query_controller import QueryController
+from schema.request import BatchSearchItem
+from service.export_service import CsvExportService
+
+
+ID_FIELDS = ("query_id", "id", "request_id")
+TEXT_FIELDS = ("query", "text", "body")
+
+
+def _first(record: dict, fields: tuple[str, ...]):
+    for field in fields:
+        if record.get(field) not in (None, ""):
+            return record[field]
+    return None
+
+
+def _safe_name(query_id) -> str:
+    """
+    File name for a query id. Ids that had to be rewritten get a short hash
+    of the original id, so two different ids never share a CSV.
+    """
+    query_id = str(query_id)
+    name = re.sub(r"[^A-Za-z0-9._-]+", "_", query_id).strip("._") or "query"
+    if name != query_id:
+        name = f"{name}_{hashlib.sha1(query_id.encode()).hexdigest()[:8]}"
+    return name
+
+
+def read_queries(
+    path: str, default_top_k: int
+) -> Iterator[tuple[str, BatchSearchItem]]:
+    """
+    Stream (query_id, item) from a JSONL file; lines without an id use the line
+    number. A repeated id is skipped instead of overwriting the first query.
+    """
+    seen: set[str] = set()
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+                text = _first(record, TEXT_FIELDS)
+                if text is None:
+                    print(f"[skip] line {line_no}: no query text")
+                    continue
+                query_id = _first(record, ID_FIELDS) or f"line{line_no:05d}"
+                item = BatchSearchItem(
+                    query=str(text)[:1000],
+                    top_k=record.get("top_k", default_top_k),
+                    score_threshold=record.get("score_threshold", 0.0),
+                    include_groups=record.get("include_groups", []),
+                    include_videos=record.get("include_videos", []),
+                    exclude_groups=record.get("exclude_groups", []),
+                )
+            except (ValueError, ValidationError) as e:
+                print(f"[skip] line {line_no}: {e}")
+                continue
+            name = _safe_name(query_id)
+            if name in seen:
+                print(f"[skip] line {line_no}: duplicate query id {query_id!r}")
+                continue
+            seen.add(name)
+            yield name, item
+
+
+def _batches(iterable, size: int):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class BatchRunner:
+    def __init__(
+        self, controller: QueryController, output_dir: Path, concurrency: int
+    ):
+        self.controller = controller
+        self.output_dir = output_dir
+        self.concurrency = max(1, concurrency)
+        self._slots = asyncio.Semaphore(self.concurrency)
+
+        self.written = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def output_path(self, query_id: str) -> Path:
+        return self.output_dir / f"{query_id}.csv"
+
+    async def run_batch(self, batch: list[tuple[str, BatchSearchItem]]):
+        todo = [(qid, item) for qid, item in batch if not self.output_path(qid).exists()]
+        self.skipped += len(batch) - len(todo)
+        if not todo:
+            return
+
+        async with self._slots:
+            try:
+                results = await self.controller.search_batch([item for _, item in todo])
+            except Exception as e:
+                self.failed += len(todo)
+                print(f"[error] batch starting at {todo[0][0]}: {e}")
+                return
+
+            for (qid, item), result in zip(todo, results):
+                try:
+                    rows = self.controller.csv_rows(result[: item.top_k])
+                    await asyncio.to_thread(
+                        CsvExportService.write_rows, self.output_path(qid), rows
+                    )
+                except Exception as e:
+                    self.failed += 1
+                    print(f"[error] {qid}: {e}")
+                    continue
+                self.written += 1
+
+    def _collect(self, done: set[asyncio.Task]):
+        """Surface errors that escaped run_batch instead of dropping the tasks"""
+        for task in done:
+            try:
+                task.result()
+            except Exception as e:
+                self.failed += 1
+                print(f"[error] batch task: {e}")
+
+    async def run(self, queries: Iterator, batch_size: int):
+        started = time.perf_counter()
+        pending: set[asyncio.Task] = set()
+        for batch in _batches(queries, batch_size):
+            pending.add(asyncio.create_task(self.run_batch(batch)))
+            # giữ số batch đang chờ có giới hạn, không đọc cả file vào bộ nhớ
+            if len(pending) >= 2 * self.concurrency:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                self._collect(done)
+                self._report(started)
+        if pending:
+            done, _ = await asyncio.wait(pending)
+            self._collect(done)
+        self._report(started)
+        return time.perf_counter() - started
+
+    def _report(self, started: float):
+        elapsed = time.perf_counter() - started
+        print(
+            f"[progress] written={self.written} skipped={self.skipped} "
+            f"failed={self.failed} elapsed={elapsed:.1f}s"
+        )
+
+
+async def main(args):
+    appsetting = AppSettings()
+    milvus_settings = KeyFrameIndexMilvusSetting()
+
+    mongo_client = await _connect_mongo(MongoDBSettings())
+    keyframe_store = await _build_keyframe_store(appsetting)
+    service_factory = _build_service_factory(appsetting, milvus_settings, keyframe_store)
+    controller = _build_query_controller(appsetting, service_factory)
+
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    runner = BatchRunner(controller, output_dir, args.concurrency)
+
+    try:
+        elapsed = await runner.run(
+            read_queries(args.queries, args.top_k), args.batch_size
+        )
+    finally:
+        service_factory.get_model_service().shutdown()
+        service_factory.get_milvus_keyframe_repo().shutdown()
+        mongo_client.close()
+
+    throughput = runner.written / elapsed if elapsed > 0 else 0.0
+    print(
+        f"[done] {runner.written} written, {runner.skipped} already done, "
+        f"{runner.failed} failed in {elapsed:.1f}s ({throughput:.1f} queries/s) "
+        f"-> {output_dir}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run a JSONL query file and write one CSV per query."
+    )
+    parser.add_argument("--queries", type=str, required=True, help="JSONL query file")
+    parser.add_argument("--output_dir", type=str, required=True)
+    parser.add_argument("--top_k", type=int, default=100)
+    parser.add_argument(
+        "--batch_size", type=int, default=32, help="Queries per embedding/search batch"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=4, help="Batches searched at the same time"
+    )
+    asyncio.run(main(parser.parse_args()))
@@ -6,15 +6,28 @@ sys.path.insert(0, ROOT_DIR)
 
 from typing import Dict, List, Optional
 from pathlib import Path
+import asyncio
 import json
 
 from agent.main_agent import KeyframeSearchAgent
 from service.search_service import KeyframeQueryService
 from service.model_service import ModelService
 from llama_index.core.llms import LLM
+from utils.asr_embeddings import AsrChunkIndex, AsrEmbeddingIndex
+from utils.detection_store import DetectionStore
+from utils.object_index import ObjectIndex
+from utils.id_range_index import IdRangeIndex
+from core.logger import SimpleLogger
+
+logger = SimpleLogger(__name__)
 
 
 class AgentController:
+    """
+    Built once at startup. The detections and ASR stores are loaded a single
+    time and shared read-only by every request; `reload_data` swaps in fresh
+    copies when the files on disk change.
+    """
 
     def __init__(
         self,
@@ -25,12 +38,24 @@ class AgentController:
         objects_data_path: Optional[Path] = None,
         asr_data_path: Optional[Path] = None,
         top_k: int = 200,
+        asr_embedding_path: Optional[Path] = None,
+        model_name: Optional[str] = None,
+        asr_chunk_path: Optional[Path] = None,
+        detection_store_path: Optional[Path] = None,
     ):
+        self.objects_data_path = objects_data_path
+        self.detection_store_path = detection_store_path
+        self.asr_data_path = asr_data_path
+        self.asr_embedding_path = asr_embedding_path
+        self.asr_chunk_path = asr_chunk_path
+        self.model_name = model_name
+        self.keyframe_store = keyframe_service.keyframe_store
+        self._reload_lock = asyncio.Lock()
 
-        objects_data = (
-            self._load_json_data(objects_data_path) if objects_data_path else {}
-        )
-        asr_data = self._load_json_data(asr_data_path) if asr_data_path else {}
+        objects_data, asr_data = self._load_stores()
+        asr_embeddings = self._load_asr_embeddings()
+        asr_chunks = self._load_asr_chunks()
+        object_index = self._build_object_index(objects_data)
 
         self.agent = KeyframeSearchAgent(
             llm=llm,
@@ -40,10 +65,123 @@ class AgentController:
             objects_data=objects_data,
             asr_data=asr_data,
             top_k=top_k,
+            asr_embeddings=asr_embeddings,
+            asr_chunks=asr_chunks,
+            object_index=object_index,
+            id_ranges=self._build_id_ranges(),
+        )
+
+    def _build_id_ranges(self) -> IdRangeIndex | None:
+        store = self.keyframe_store
+        if store is None or len(store) == 0:
+            return None
+        keys = store.present.nonzero()[0]
+        return IdRangeIndex.from_columns(keys, store.group_num[keys], store.video_num[keys])
+
+    def _load_json_data(self, path: Path) -> dict:
+        if not path.exists():
+            logger.warning(f"Data file does not exist: {path}")
+            return {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except json.JSONDecodeError as e:
+            logger.warning(f"Could not parse {path}: {e}")
+            return {}
+
+    def _load_objects(self) -> DetectionStore | dict:
+        """The memory-mapped detection store when built, else detections.json"""
+        path = self.detection_store_path
+        if path is not None and path.exists():
+            return DetectionStore.open(str(path))
+        if self.objects_data_path is None:
+            return {}
+        logger.warning(
+            f"Detection store not found ({path}), loading {self.objects_data_path}"
+        )
+        return self._load_json_data(self.objects_data_path)
+
+    def _load_stores(self) -> tuple[DetectionStore | dict, dict]:
+        objects_data = self._load_objects()
+        asr_data = self._load_json_data(self.asr_data_path) if self.asr_data_path else {}
+        logger.info(
+            f"Loaded {len(objects_data)} object records and {len(asr_data)} ASR records"
+        )
+        return objects_data, asr_data
+
+    def _open_asr_index(self, path: Optional[Path], index_cls, what: str):
+        if path is None or not path.exists():
+            logger.warning(f"{what} not found ({path})")
+            return None
+        index = index_cls.open(str(path))
+        if self.model_name and index.model_name != self.model_name:
+            logger.warning(
+                f"{what} in {path} were built with {index.model_name}, "
+                f"not {self.model_name}; ignoring them"
+            )
+            return None
+        return index
+
+    def _load_asr_embeddings(self) -> AsrEmbeddingIndex | None:
+        index = self._open_asr_index(
+            self.asr_embedding_path, AsrEmbeddingIndex, "ASR embeddings"
+        )
+        if index is None:
+            logger.warning("ASR is embedded per query")
+        else:
+            logger.info(f"Loaded ASR embeddings for {len(index)} videos")
+        return index
+
+    def _load_asr_chunks(self) -> AsrChunkIndex | None:
+        index = self._open_asr_index(self.asr_chunk_path, AsrChunkIndex, "ASR chunks")
+        if index is None:
+            logger.warning("Answers fall back to the start of each video's ASR")
+        else:
+            logger.info(f"Loaded {len(index)} timed ASR chunks")
+        return index
+
+    def _build_object_index(
+        self, objects_data: DetectionStore | dict
+    ) -> ObjectIndex | None:
+        if not len(objects_data):
+            return None
+        if isinstance(objects_data, DetectionStore):
+            index = objects_data.object_index()
+        elif self.keyframe_store is None:
+            logger.warning("No keyframe store, object filters run after search")
+            return None
+        else:
+            index = ObjectIndex.from_detections(objects_data, self.keyframe_store)
+        logger.info(
+            f"Object index: {len(index)} classes over {len(index.ids)} (class, keyframe) pairs"
         )
+        return index
 
-    def _load_json_data(self, path: Path):
-        return json.load(open(path))
+    async def reload_data(self) -> Dict[str, int]:
+        """
+        Re-read detections and ASR from disk off the event loop, then swap them
+        into the agent. Requests already running keep the stores they started with.
+        """
+        async with self._reload_lock:
+            objects_data, asr_data = await asyncio.to_thread(self._load_stores)
+            asr_embeddings = await asyncio.to_thread(self._load_asr_embeddings)
+            asr_chunks = await asyncio.to_thread(self._load_asr_chunks)
+            object_index = await asyncio.to_thread(
+                self._build_object_index, objects_data
+            )
+            self.agent.update_data(
+                objects_data=objects_data,
+                asr_data=asr_data,
+                asr_embeddings=asr_embeddings,
+                asr_chunks=asr_chunks,
+                object_index=object_index,
+            )
+        return {
+            "objects": len(objects_data),
+            "asr": len(asr_data),
+            "asr_embeddings": len(asr_embeddings) if asr_embeddings else 0,
+            "asr_chunks": len(asr_chunks) if asr_chunks else 0,
+        }
 
     async def search_and_answer(self, user_query: str) -> str:
         return await self.agent.process_query(user_query)
@@ -1,5 +1,4 @@
 from pathlib import Path
-from functools import lru_cache
 from typing import List
 import json
 
@@ -7,15 +6,19 @@ import os
 import sys
 
 from utils.map_index import n_to_frame_idx
-import csv
-from datetime import datetime
 
 ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../"))
 
 sys.path.insert(0, ROOT_DIR)
 
 from service import ModelService, KeyframeQueryService
+from service.export_service import CsvExportService
 from schema.response import KeyframeServiceReponse
+from schema.request import BatchSearchItem
+from core.settings import AppSettings
+from utils.milvus_filter import build_scalar_filter, compile_id_filter
+from utils.id_range_index import IdRangeIndex
+from utils.frame_index import FrameIndex
 
 
 class QueryController:
@@ -26,53 +29,65 @@ class QueryController:
         id2index_path: Path,
         model_service: ModelService,
         keyframe_service: KeyframeQueryService,
+        app_settings: AppSettings | None = None,
     ):
         self.data_folder = data_folder
-        self.id2index = json.load(open(id2index_path, "r"))
         self.model_service = model_service
         self.keyframe_service = keyframe_service
+        self.id_ranges = self._build_id_ranges(id2index_path)
 
-        # New
-        from core.settings import AppSettings
-
-        self.app_settings = AppSettings()
+        self.app_settings = app_settings or AppSettings()
         os.makedirs(self.app_settings.RESULT_DIR, exist_ok=True)
 
+        self.export_service = CsvExportService(
+            result_dir=self.app_settings.RESULT_DIR,
+            build_rows=self.csv_rows,
+            max_files=self.app_settings.EXPORT_MAX_FILES,
+            max_age_seconds=self.app_settings.EXPORT_MAX_AGE_HOURS * 3600,
+            max_pending=self.app_settings.EXPORT_MAX_PENDING,
+            eager=self.app_settings.EXPORT_EAGER,
+            wait_seconds=self.app_settings.EXPORT_WAIT_SECONDS,
+        )
+
+        # None nếu chưa build frame index -> đọc thẳng từ map-keyframes CSV
+        self.frame_index: FrameIndex | None = None
+        if os.path.exists(self.app_settings.FRAME_INDEX_PATH):
+            self.frame_index = FrameIndex.open(self.app_settings.FRAME_INDEX_PATH)
+
+    def _build_id_ranges(self, id2index_path: Path) -> IdRangeIndex:
+        store = self.keyframe_service.keyframe_store
+        if store is not None and len(store) > 0:
+            keys = store.present.nonzero()[0]
+            return IdRangeIndex.from_columns(
+                keys, store.group_num[keys], store.video_num[keys]
+            )
+        with open(id2index_path, "r") as f:
+            return IdRangeIndex.from_id2index(json.load(f))
+
     def _video_name(self, prefix: str, group_num: int, video_num: int) -> str:
         return f"{prefix}{group_num:02d}_V{video_num:03d}"
 
-    def _export_topk_csv(
-        self, items: list[KeyframeServiceReponse], k: int = 100
-    ) -> str:
+    def csv_rows(self, items: list[KeyframeServiceReponse]) -> list[tuple[str, int]]:
         """
-        Ghi file CSV dạng: <video_name>, <frame_idx>
+        Các dòng CSV dạng: <video_name>, <frame_idx>
         video_name: 'Lxx_Vyyy'
-        frame_idx: lấy từ data/map-keyframes/Lxx_Vyyy.csv, map cột 'n' == keyframe_num.
+        frame_idx: tra trong frame index theo key; thiếu thì lấy từ
+                   data/map-keyframes/Lxx_Vyyy.csv, map cột 'n' == keyframe_num.
         """
-        out_path = os.path.join(
-            self.app_settings.RESULT_DIR,
-            f"query_top{min(k, len(items))}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-        )
-        rows = []
-        for kf in items[:k]:
-            video_name = self._video_name(kf.prefix, kf.group_num, kf.video_num)
-            frame_idx = n_to_frame_idx(
-                self.app_settings.MAP_KEYFRAME_DIR,
-                kf.prefix,
-                kf.group_num,
-                kf.video_num,
-                kf.keyframe_num,
-            )
-            if frame_idx is None:
-                # fallback (nếu thiếu mapping), có thể ghi -1
-                frame_idx = -1
-            rows.append((video_name, frame_idx))
+        frame_indices = self._frame_indices(items)
+        return [
+            (self._video_name(kf.prefix, kf.group_num, kf.video_num), frame_idx)
+            for kf, frame_idx in zip(items, frame_indices)
+        ]
 
-        with open(out_path, "w", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            # writer.writerow(["video_name", "frame_idx"])
-            writer.writerows(rows)
-        return out_path
+    def export_topk_csv(
+        self, items: list[KeyframeServiceReponse], k: int = 100
+    ) -> str:
+        """
+        Đăng ký export top-k và trả về tên file ngay; file được ghi ở background
+        hoặc khi /download lần đầu (xem CsvExportService).
+        """
+        return self.export_service.submit(items, k)
 
     # --------
 
@@ -85,8 +100,54 @@ class QueryController:
             model.confidence_score,
         )
 
+    def _group_video_filter(
+        self,
+        include_groups: list[int] | None = None,
+        include_videos: list[int] | None = None,
+        exclude_groups: list[int] | None = None,
+    ) -> tuple[str | None, list[str] | None]:
+        """
+        Group constraints become partition names when the collection is
+        partitioned by group; whatever is left goes into a scalar expression.
+        Collections without the scalar fields get an id-range expression
+        built from the precomputed group/video index instead.
+        """
+        partitions = self.keyframe_service.partitions_for_groups(
+            include_groups, exclude_groups
+        )
+        if not self.keyframe_service.supports_scalar_filter:
+            return (
+                self._id_range_filter(include_groups, include_videos, exclude_groups),
+                partitions,
+            )
+
+        if partitions is not None:
+            include_groups = exclude_groups = None
+        expr = build_scalar_filter(
+            include_groups=include_groups,
+            include_videos=include_videos,
+            exclude_groups=exclude_groups,
+        )
+        return expr, partitions
+
+    def _id_range_filter(
+        self,
+        include_groups: list[int] | None = None,
+        include_videos: list[int] | None = None,
+        exclude_groups: list[int] | None = None,
+    ) -> str | None:
+        include_ranges = None
+        if include_groups or include_videos:
+            include_ranges = self.id_ranges.ranges_for(include_groups, include_videos)
+        exclude_ranges = None
+        if exclude_groups:
+            exclude_ranges = self.id_ranges.ranges_for(groups=exclude_groups)
+        return compile_id_filter(
+            include_ranges=include_ranges, exclude_ranges=exclude_ranges
+        )
+
     async def search_text(self, query: str, top_k: int, score_threshold: float):
-        embedding = self.model_service.embedding(query).tolist()[0]
+        embedding = (await self.model_service.aembedding(query)).tolist()[0]
 
         result = await self.keyframe_service.search_by_text(
             embedding, top_k, score_threshold
@@ -100,17 +161,11 @@ class QueryController:
         score_threshold: float,
         list_group_exlude: list[int],
     ):
-        exclude_ids = [
-            int(k)
-            for k, v in self.id2index.items()
-            if int(v.split("/")[0]) in list_group_exlude
-        ]
-
-        embedding = self.model_service.embedding(query).tolist()[0]
-        result = await self.keyframe_service.search_by_text_exclude_ids(
-            embedding, top_k, score_threshold, exclude_ids
+        expr, partitions = self._group_video_filter(exclude_groups=list_group_exlude)
+        embedding = (await self.model_service.aembedding(query)).tolist()[0]
+        return await self.keyframe_service.search_by_text_filter(
+            embedding, top_k, score_threshold, expr, partitions
         )
-        return result
 
     async def search_with_selected_video_group(
         self,
@@ -120,66 +175,62 @@ class QueryController:
         list_of_include_groups: list[int],
         list_of_include_videos: list[int],
     ):
+        expr, partitions = self._group_video_filter(
+            include_groups=list_of_include_groups,
+            include_videos=list_of_include_videos,
+        )
+        embedding = (await self.model_service.aembedding(query)).tolist()[0]
+        return await self.keyframe_service.search_by_text_filter(
+            embedding, top_k, score_threshold, expr, partitions
+        )
 
-        exclude_ids = None
-        if len(list_of_include_groups) > 0 and len(list_of_include_videos) == 0:
-            print("hi")
-            exclude_ids = [
-                int(k)
-                for k, v in self.id2index.items()
-                if int(v.split("/")[0]) not in list_of_include_groups
-            ]
-
-        elif len(list_of_include_groups) == 0 and len(list_of_include_videos) > 0:
-            exclude_ids = [
-                int(k)
-                for k, v in self.id2index.items()
-                if int(v.split("/")[1]) not in list_of_include_videos
-            ]
-
-        elif len(list_of_include_groups) == 0 and len(list_of_include_videos) == 0:
-            exclude_ids = []
-        else:
-            exclude_ids = [
-                int(k)
-                for k, v in self.id2index.items()
-                if (
-                    int(v.split("/")[0]) not in list_of_include_groups
-                    or int(v.split("/")[1]) not in list_of_include_videos
-                )
-            ]
+    async def search_batch(
+        self, queries: list[BatchSearchItem]
+    ) -> list[list[KeyframeServiceReponse]]:
+        # một batch CLIP cho tất cả query (query đã cache thì bỏ qua)
+        embeddings = (
+            await self.model_service.aembedding_many([q.query for q in queries])
+        ).tolist()
 
-        embedding = self.model_service.embedding(query).tolist()[0]
-        result = await self.keyframe_service.search_by_text_exclude_ids(
-            embedding, top_k, score_threshold, exclude_ids
+        filters = [
+            self._group_video_filter(
+                include_groups=q.include_groups,
+                include_videos=q.include_videos,
+                exclude_groups=q.exclude_groups,
+            )
+            for q in queries
+        ]
+        return await self.keyframe_service.search_batch(
+            text_embeddings=embeddings,
+            top_ks=[q.top_k for q in queries],
+            score_thresholds=[q.score_threshold for q in queries],
+            filter_exprs=[expr for expr, _ in filters],
+            partition_names=[partitions for _, partitions in filters],
         )
-        return result
 
-    @lru_cache(maxsize=512)
-    def _load_map_for_video(
-        self, prefix: str, group_num: int, video_num: int
-    ) -> dict[int, int]:
-        """
-        Đọc file data/map-keyframes/L{group:02d}_V{video:03d}.csv
-        trả về {keyframe_num -> frame_idx}
-        """
-        fname = f"{prefix}{group_num:02d}_V{video_num:03d}.csv"
-        map_path = os.path.join(self.data_folder.parent, "map-keyframes", fname)
-        mapping: dict[int, int] = {}
-        if os.path.exists(map_path):
-            with open(map_path, newline="", encoding="utf-8") as f:
-                reader = csv.DictReader(f)
-                # file mẫu có cột n, pts_time, fps, frame_idx
-                for row in reader:
-                    n = int(row["n"])
-                    mapping[n] = int(float(row["frame_idx"]))
-        return mapping
-
-    def _frame_idx_of(
-        self, prefix: str, group_num: int, video_num: int, keyframe_num: int
-    ) -> int | None:
-        mp = self._load_map_for_video(prefix, group_num, video_num)
-        return mp.get(keyframe_num)
+    def _frame_indices(self, items: list[KeyframeServiceReponse]) -> list[int]:
+        """frame_idx cho cả danh sách kết quả, -1 nếu không có mapping"""
+        if self.frame_index is not None:
+            frame_indices = self.frame_index.frame_idx_of([kf.key for kf in items]).tolist()
+        else:
+            frame_indices = [-1] * len(items)
+
+        for i, kf in enumerate(items):
+            if frame_indices[i] >= 0:
+                continue
+            try:
+                frame_idx = n_to_frame_idx(
+                    self.app_settings.MAP_KEYFRAME_DIR,
+                    kf.prefix,
+                    kf.group_num,
+                    kf.video_num,
+                    kf.keyframe_num,
+                )
+            except FileNotFoundError:
+                frame_idx = None
+            # fallback (nếu thiếu mapping), ghi -1
+            frame_indices[i] = -1 if frame_idx is None else frame_idx
+        return frame_indices
 
     async def trake_search(
         self,
@@ -187,15 +238,24 @@ class QueryController:
         top_k: int,
         score_threshold: float,
         max_kf_gap: int,
-    ) -> List[KeyframeServiceReponse]:
-        # embed từng stage
-        stage_embeddings = [
-            self.model_service.embedding(ev).tolist()[0] for ev in events
-        ]
-        seq = await self.keyframe_service.trake_beam_search(
+        num_sequences: int = 1,
+        one_per_video: bool = False,
+        max_gap_seconds: float | None = None,
+        min_gap_seconds: float = 0.0,
+    ) -> list[tuple[float, List[KeyframeServiceReponse]]]:
+        # embed tất cả stage trong một forward pass
+        stage_embeddings = (await self.model_service.aembedding_many(events)).tolist()
+        # aligner chính xác nên có thể lấy nhiều ứng viên hơn beam cũ
+        sequences = await self.keyframe_service.trake_align_search(
             stage_embeddings=stage_embeddings,
-            beam_width=top_k,
+            candidates_per_stage=min(max(top_k * 20, 200), 500),
             score_threshold=score_threshold,
             max_kf_gap=max_kf_gap,
+            id_ranges=self.id_ranges,
+            num_sequences=num_sequences,
+            one_per_video=one_per_video,
+            max_gap_seconds=max_gap_seconds,
+            min_gap_seconds=min_gap_seconds,
+            frame_index=self.frame_index,
         )
-        return seq
+        return sequences
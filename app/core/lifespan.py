@@ -1,8 +1,10 @@
 from contextlib import asynccontextmanager
+from pathlib import Path
 from fastapi import FastAPI
 from motor.motor_asyncio import AsyncIOMotorClient
 from beanie import init_beanie
 
+import json
 import os
 import sys
 
@@ -14,13 +16,148 @@ sys.path.insert(0, ROOT_DIR)
 from core.settings import MongoDBSettings, KeyFrameIndexMilvusSetting, AppSettings
 from models.keyframe import Keyframe
 from factory.factory import ServiceFactory
+from repository.mongo import KeyframeRepository
+from repository.keyframe_store import KeyframeMetadataStore
+from controller.query_controller import QueryController
+from controller.agent_controller import AgentController
+from core.dependencies import get_llm
 from core.logger import SimpleLogger
 
 mongo_client: AsyncIOMotorClient = None
 service_factory: ServiceFactory = None
+query_controller: QueryController = None
+agent_controller: AgentController | None = None
 logger = SimpleLogger(__name__)
 
 
+async def _build_keyframe_store(
+    app_settings: AppSettings,
+) -> KeyframeMetadataStore | None:
+    """
+    Load the keyframe metadata into memory once: from id2index.json when it is
+    available, otherwise from Mongo. Without a store every search falls back
+    to a Mongo lookup.
+    """
+    try:
+        id2index_path = Path(app_settings.ID2INDEX_PATH)
+        if id2index_path.exists() and id2index_path.stat().st_size > 2:
+            store = KeyframeMetadataStore.from_id2index(str(id2index_path))
+            source = str(id2index_path)
+        else:
+            store = await KeyframeMetadataStore.from_mongo(
+                KeyframeRepository(collection=Keyframe)
+            )
+            source = "MongoDB"
+        logger.info(f"Keyframe metadata store loaded {len(store)} keyframes from {source}")
+        return store
+    except Exception as e:
+        logger.error(f"Failed to build keyframe metadata store: {e}")
+        return None
+
+
+async def _connect_mongo(mongo_settings: MongoDBSettings) -> AsyncIOMotorClient:
+    mongo_connection_string = (
+        f"mongodb://{mongo_settings.MONGO_USER}:{mongo_settings.MONGO_PASSWORD}"
+        f"@{mongo_settings.MONGO_HOST}:{mongo_settings.MONGO_PORT}"
+    )
+
+    client = AsyncIOMotorClient(mongo_connection_string)
+
+    await client.admin.command("ping")
+    logger.info("Successfully connected to MongoDB")
+
+    database = client[mongo_settings.MONGO_DB]
+    await init_beanie(database=database, document_models=[Keyframe])
+    logger.info("Beanie initialized successfully")
+    return client
+
+
+def _build_service_factory(
+    appsetting: AppSettings,
+    milvus_settings: KeyFrameIndexMilvusSetting,
+    keyframe_store: KeyframeMetadataStore | None,
+) -> ServiceFactory:
+    milvus_search_params = {
+        "metric_type": milvus_settings.METRIC_TYPE,
+        "params": milvus_settings.SEARCH_PARAMS,
+    }
+
+    return ServiceFactory(
+        milvus_collection_name=milvus_settings.COLLECTION_NAME,
+        milvus_host=milvus_settings.HOST,
+        milvus_port=milvus_settings.PORT,
+        milvus_user="",
+        milvus_password="",
+        milvus_search_params=milvus_search_params,
+        model_name=appsetting.MODEL_NAME,
+        mongo_collection=Keyframe,
+        embed_batch_window_ms=appsetting.EMBED_BATCH_WINDOW_MS,
+        embed_max_batch_size=appsetting.EMBED_MAX_BATCH_SIZE,
+        inference_workers=appsetting.INFERENCE_WORKERS,
+        inference_torch_threads=appsetting.INFERENCE_TORCH_THREADS,
+        embed_cache_size=appsetting.EMBED_CACHE_SIZE,
+        embed_cache_path=appsetting.EMBED_CACHE_PATH,
+        milvus_search_workers=milvus_settings.SEARCH_WORKERS,
+        keyframe_store=keyframe_store,
+    )
+
+
+def _build_query_controller(
+    app_settings: AppSettings, service_factory: ServiceFactory
+) -> QueryController:
+    """
+    Build the single QueryController shared by every request. It owns the
+    group/video id-range index and the per-video lru caches, so they survive between
+    requests instead of being rebuilt on each call.
+    """
+    data_folder = Path(app_settings.DATA_FOLDER)
+    id2index_path = Path(app_settings.ID2INDEX_PATH)
+
+    if not data_folder.exists():
+        logger.warning(f"Data folder does not exist: {data_folder}")
+        data_folder.mkdir(parents=True, exist_ok=True)
+
+    if not id2index_path.exists():
+        logger.warning(f"ID2Index file does not exist: {id2index_path}")
+        id2index_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(id2index_path, "w") as f:
+            json.dump({}, f)
+
+    return QueryController(
+        data_folder=data_folder,
+        id2index_path=id2index_path,
+        model_service=service_factory.get_model_service(),
+        keyframe_service=service_factory.get_keyframe_query_service(),
+        app_settings=app_settings,
+    )
+
+
+def _build_agent_controller(
+    app_settings: AppSettings, service_factory: ServiceFactory
+) -> AgentController | None:
+    """
+    Build the single AgentController. Detections and ASR are read from disk
+    here once and shared read-only; a failure only disables the agent routes.
+    """
+    try:
+        return AgentController(
+            llm=get_llm(),
+            keyframe_service=service_factory.get_keyframe_query_service(),
+            model_service=service_factory.get_model_service(),
+            data_folder=app_settings.DATA_FOLDER,
+            objects_data_path=Path(app_settings.FRAME2OBJECT),
+            detection_store_path=Path(app_settings.DETECTION_STORE_PATH),
+            asr_data_path=Path(app_settings.ASR_PATH),
+            top_k=50,
+            asr_embedding_path=Path(app_settings.ASR_EMBEDDING_PATH),
+            asr_chunk_path=Path(app_settings.ASR_CHUNK_INDEX_PATH),
+            model_name=app_settings.MODEL_NAME,
+        )
+    except Exception as e:
+        logger.error(f"Failed to initialize agent controller: {e}")
+        return None
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
@@ -33,40 +170,30 @@ async def lifespan(app: FastAPI):
         milvus_settings = KeyFrameIndexMilvusSetting()
         appsetting = AppSettings()
         global mongo_client
-        mongo_connection_string = (
-            f"mongodb://{mongo_settings.MONGO_USER}:{mongo_settings.MONGO_PASSWORD}"
-            f"@{mongo_settings.MONGO_HOST}:{mongo_settings.MONGO_PORT}"
-        )
-
-        mongo_client = AsyncIOMotorClient(mongo_connection_string)
+        mongo_client = await _connect_mongo(mongo_settings)
 
-        await mongo_client.admin.command("ping")
-        logger.info("Successfully connected to MongoDB")
-
-        database = mongo_client[mongo_settings.MONGO_DB]
-        await init_beanie(database=database, document_models=[Keyframe])
-        logger.info("Beanie initialized successfully")
+        keyframe_store = await _build_keyframe_store(appsetting)
 
         global service_factory
-        milvus_search_params = {
-            "metric_type": milvus_settings.METRIC_TYPE,
-            "params": milvus_settings.SEARCH_PARAMS,
-        }
-
-        service_factory = ServiceFactory(
-            milvus_collection_name=milvus_settings.COLLECTION_NAME,
-            milvus_host=milvus_settings.HOST,
-            milvus_port=milvus_settings.PORT,
-            milvus_user="",
-            milvus_password="",
-            milvus_search_params=milvus_search_params,
-            model_name=appsetting.MODEL_NAME,
-            mongo_collection=Keyframe,
+        service_factory = _build_service_factory(
+            appsetting, milvus_settings, keyframe_store
         )
         logger.info("Service factory initialized successfully")
 
+        global query_controller
+        query_controller = _build_query_controller(appsetting, service_factory)
+        await query_controller.export_service.start()
+        logger.info("Query controller initialized successfully")
+
+        global agent_controller
+        agent_controller = _build_agent_controller(appsetting, service_factory)
+        if agent_controller is not None:
+            logger.info("Agent controller initialized successfully")
+
         app.state.service_factory = service_factory
         app.state.mongo_client = mongo_client
+        app.state.query_controller = query_controller
+        app.state.agent_controller = agent_controller
 
         logger.info("Application startup completed successfully")
 
@@ -79,10 +206,18 @@ async def lifespan(app: FastAPI):
     logger.info("Shutting down application...")
 
     try:
+        if query_controller:
+            await query_controller.export_service.stop()
+
         if mongo_client:
             mongo_client.close()
             logger.info("MongoDB connection closed")
 
+        if service_factory:
+            service_factory.get_model_service().shutdown()
+            service_factory.get_milvus_keyframe_repo().shutdown()
+            logger.info("Inference and Milvus search executors stopped")
+
         logger.info("Application shutdown completed successfully")
 
     except Exception as e:
@@ -29,6 +29,7 @@ class KeyFrameIndexMilvusSetting(BaseSettings):
     INDEX_TYPE: str = "FLAT"
     BATCH_SIZE: int = 10000
     SEARCH_PARAMS: dict = {}
+    SEARCH_WORKERS: int = 4
 
 
 ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
@@ -48,6 +49,32 @@ class AppSettings(BaseSettings):
     # MODEL_NAME: str = "hf-hub:laion/CLIP-convnext_xxlarge-laion2B-s34B-b82K-augreg-soup"
     MODEL_NAME: str = "ViT-B-32-quickgelu"
     FRAME2OBJECT: str = os.path.join(ROOT_DIR, "data/detections.json")
+    # detections dạng CSR memory-map, build bằng migration/detection_store_migration.py
+    DETECTION_STORE_PATH: str = os.path.join(ROOT_DIR, "data/detections.bin")
     ASR_PATH: str = os.path.join(ROOT_DIR, "data/asr_proc.json")
+    # embedding ASR theo video, build bằng migration/asr_embedding_migration.py
+    ASR_EMBEDDING_PATH: str = os.path.join(ROOT_DIR, "data/asr_embeddings.bin")
+    # các đoạn ASR theo thời gian + keyframe id -> đoạn, build cùng lúc với trên
+    ASR_CHUNK_INDEX_PATH: str = os.path.join(ROOT_DIR, "data/asr_chunks.bin")
     MAP_KEYFRAME_DIR: str = os.path.join(ROOT_DIR, "data/map-keyframes")
+    # bảng gộp của map-keyframes, build bằng migration/frame_index_migration.py
+    FRAME_INDEX_PATH: str = os.path.join(ROOT_DIR, "data/frame_index.bin")
     RESULT_DIR: str = os.path.join(ROOT_DIR, "data/results")
+    # CSV export: ghi ở background (EXPORT_EAGER) hoặc khi /download lần đầu;
+    # RESULT_DIR giữ tối đa EXPORT_MAX_FILES file, mỗi file EXPORT_MAX_AGE_HOURS
+    EXPORT_EAGER: bool = True
+    EXPORT_MAX_FILES: int = 500
+    EXPORT_MAX_AGE_HOURS: float = 24.0
+    EXPORT_MAX_PENDING: int = 1000
+    # /download ở worker khác: chờ file do worker đã search ghi ra (cần EXPORT_EAGER)
+    EXPORT_WAIT_SECONDS: float = 10.0
+
+    # Micro-batching cho text embedding
+    EMBED_BATCH_WINDOW_MS: float = 3.0
+    EMBED_MAX_BATCH_SIZE: int = 32
+    # Thread pool cho CLIP inference; 0 = chia đều CPU cho các worker
+    INFERENCE_WORKERS: int = 1
+    INFERENCE_TORCH_THREADS: int = 0
+    # LRU cache cho query embedding; đặt EMBED_CACHE_PATH để lưu xuống đĩa
+    EMBED_CACHE_SIZE: int = 10000
+    EMBED_CACHE_PATH: str | None = None
@@ -9,7 +9,9 @@ sys.path.insert(0, ROOT_DIR)
 
 from repository.mongo import KeyframeRepository
 from repository.milvus import KeyframeVectorRepository
+from repository.keyframe_store import KeyframeMetadataStore
 from service import KeyframeQueryService, ModelService
+from service.embedding_cache import EmbeddingCache
 from models.keyframe import Keyframe
 import open_clip
 from pymilvus import connections, Collection as MilvusCollection
@@ -28,6 +30,14 @@ class ServiceFactory:
         milvus_db_name: str = "default",
         milvus_alias: str = "default",
         mongo_collection=Keyframe,
+        embed_batch_window_ms: float = 3.0,
+        embed_max_batch_size: int = 32,
+        inference_workers: int = 1,
+        inference_torch_threads: int = 0,
+        embed_cache_size: int = 10000,
+        embed_cache_path: str | None = None,
+        milvus_search_workers: int = 4,
+        keyframe_store: KeyframeMetadataStore | None = None,
     ):
         self._mongo_keyframe_repo = KeyframeRepository(collection=mongo_collection)
         self._milvus_keyframe_repo = self._init_milvus_repo(
@@ -39,13 +49,23 @@ class ServiceFactory:
             password=milvus_password,
             db_name=milvus_db_name,
             alias=milvus_alias,
+            search_workers=milvus_search_workers,
         )
 
-        self._model_service = self._init_model_service(model_name)
+        self._model_service = self._init_model_service(
+            model_name,
+            batch_window_ms=embed_batch_window_ms,
+            max_batch_size=embed_max_batch_size,
+            inference_workers=inference_workers,
+            torch_threads=inference_torch_threads,
+            cache_size=embed_cache_size,
+            cache_path=embed_cache_path,
+        )
 
         self._keyframe_query_service = KeyframeQueryService(
             keyframe_mongo_repo=self._mongo_keyframe_repo,
             keyframe_vector_repo=self._milvus_keyframe_repo,
+            keyframe_store=keyframe_store,
         )
 
     def _init_milvus_repo(
@@ -58,6 +78,7 @@ class ServiceFactory:
         password: str,
         db_name: str = "default",
         alias: str = "default",
+        search_workers: int = 4,
     ):
         if connections.has_connection(alias):
             connections.remove_connection(alias)
@@ -72,10 +93,21 @@ class ServiceFactory:
         collection = MilvusCollection(collection_name, using=alias)
 
         return KeyframeVectorRepository(
-            collection=collection, search_params=search_params
+            collection=collection,
+            search_params=search_params,
+            search_workers=search_workers,
         )
 
-    def _init_model_service(self, model_name: str):
+    def _init_model_service(
+        self,
+        model_name: str,
+        batch_window_ms: float,
+        max_batch_size: int,
+        inference_workers: int,
+        torch_threads: int,
+        cache_size: int,
+        cache_path: str | None,
+    ):
         pretrained = "openai"  # hoặc chọn đúng chuỗi của model bạn dùng
         device = "cuda" if torch.cuda.is_available() else "cpu"
 
@@ -84,8 +116,23 @@ class ServiceFactory:
         )
         model = model.to(device)
         tokenizer = open_clip.get_tokenizer(model_name)
+        cache = (
+            EmbeddingCache(
+                model_name=model_name, max_entries=cache_size, persist_path=cache_path
+            )
+            if cache_size > 0
+            else None
+        )
         return ModelService(
-            model=model, preprocess=preprocess, tokenizer=tokenizer, device=device
+            model=model,
+            preprocess=preprocess,
+            tokenizer=tokenizer,
+            device=device,
+            batch_window_ms=batch_window_ms,
+            max_batch_size=max_batch_size,
+            inference_workers=inference_workers,
+            torch_threads=torch_threads,
+            cache=cache,
         )
 
     def get_mongo_keyframe_repo(self):
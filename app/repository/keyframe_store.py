@@ -0,0 +1,175 @@
+"""
+In-memory, columnar copy of the keyframe metadata (key -> prefix, group, video,
+keyframe_num). Resolving a batch of search hits is one NumPy fancy-indexing
+operation instead of a Mongo round trip; Mongo stays the source of truth and
+the fallback for keys the store does not know.
+"""
+
+import os
+import sys
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../"))
+sys.path.insert(0, ROOT_DIR)
+
+import json
+from typing import Iterable
+
+import numpy as np
+
+from repository.mongo import KeyframeRepository
+from schema.interface import KeyframeInterface
+
+
+class KeyframeMetadataStore:
+    def __init__(
+        self,
+        keys: np.ndarray,
+        prefixes: list[str],
+        group_num: np.ndarray,
+        video_num: np.ndarray,
+        keyframe_num: np.ndarray,
+    ):
+        """
+        All arrays are row-aligned with `keys`; `prefixes` holds one string
+        per row. Columns are re-laid out so that row index == key.
+        """
+        keys = np.asarray(keys, dtype=np.int64)
+        size = int(keys.max()) + 1 if len(keys) else 0
+
+        prefix_table, prefix_codes = np.unique(
+            np.asarray(prefixes, dtype=str), return_inverse=True
+        )
+        self.prefix_table: list[str] = prefix_table.tolist()
+
+        self.present = np.zeros(size, dtype=bool)
+        self.prefix_code = np.zeros(size, dtype=np.uint8)
+        self.group_num = np.zeros(size, dtype=np.int16)
+        self.video_num = np.zeros(size, dtype=np.int16)
+        self.keyframe_num = np.zeros(size, dtype=np.int32)
+
+        self.present[keys] = True
+        self.prefix_code[keys] = prefix_codes
+        self.group_num[keys] = group_num
+        self.video_num[keys] = video_num
+        self.keyframe_num[keys] = keyframe_num
+
+        # (prefix, group, video, keyframe_num) -> key, dựng khi cần tra ngược
+        self._lookup_key: np.ndarray | None = None
+        self._lookup_id: np.ndarray | None = None
+
+    def __len__(self) -> int:
+        return int(self.present.sum())
+
+    @property
+    def size(self) -> int:
+        """Largest key + 1"""
+        return len(self.present)
+
+    @classmethod
+    def from_id2index(cls, id2index_path: str) -> "KeyframeMetadataStore":
+        """id2index.json: {"<key>": "<group>/<video>/<keyframe_num>"}, prefix 'L'"""
+        with open(id2index_path, "r", encoding="utf-8") as f:
+            id2index: dict[str, str] = json.load(f)
+
+        n = len(id2index)
+        keys = np.fromiter((int(k) for k in id2index), dtype=np.int64, count=n)
+        parts = np.array(
+            [v.split("/") for v in id2index.values()], dtype=np.int64
+        ).reshape(n, 3)
+        return cls(
+            keys=keys,
+            prefixes=["L"] * n,
+            group_num=parts[:, 0],
+            video_num=parts[:, 1],
+            keyframe_num=parts[:, 2],
+        )
+
+    @classmethod
+    async def from_mongo(cls, repo: KeyframeRepository) -> "KeyframeMetadataStore":
+        keyframes = await repo.get_all()
+        return cls(
+            keys=np.array([k.key for k in keyframes], dtype=np.int64),
+            prefixes=[getattr(k, "prefix", "L") for k in keyframes],
+            group_num=np.array([k.group_num for k in keyframes], dtype=np.int64),
+            video_num=np.array([k.video_num for k in keyframes], dtype=np.int64),
+            keyframe_num=np.array([k.keyframe_num for k in keyframes], dtype=np.int64),
+        )
+
+    def contains(self, ids: Iterable[int]) -> np.ndarray:
+        ids = np.asarray(list(ids), dtype=np.int64)
+        mask = (ids >= 0) & (ids < self.size)
+        mask[mask] = self.present[ids[mask]]
+        return mask
+
+    @staticmethod
+    def pack(prefix_code, group_num, video_num, keyframe_num) -> np.ndarray:
+        """(prefix code, group, video, keyframe_num) -> one sortable int64"""
+        return (
+            (np.asarray(prefix_code, dtype=np.int64) << 56)
+            | (np.asarray(group_num, dtype=np.int64) << 40)
+            | (np.asarray(video_num, dtype=np.int64) << 24)
+            | np.asarray(keyframe_num, dtype=np.int64)
+        )
+
+    def lookup_ids(
+        self,
+        prefixes: list[str],
+        group_num: Iterable[int],
+        video_num: Iterable[int],
+        keyframe_num: Iterable[int],
+    ) -> np.ndarray:
+        """Reverse lookup (prefix, group, video, keyframe_num) -> key, -1 if unknown"""
+        if self._lookup_key is None:
+            present = np.flatnonzero(self.present)
+            packed = self.pack(
+                self.prefix_code[present],
+                self.group_num[present],
+                self.video_num[present],
+                self.keyframe_num[present],
+            )
+            order = np.argsort(packed, kind="stable")
+            self._lookup_key, self._lookup_id = packed[order], present[order]
+
+        code_of = {p: i for i, p in enumerate(self.prefix_table)}
+        prefix_code = np.array([code_of.get(p, -1) for p in prefixes], dtype=np.int64)
+        query = self.pack(
+            prefix_code.clip(0),
+            np.fromiter(group_num, dtype=np.int64),
+            np.fromiter(video_num, dtype=np.int64),
+            np.fromiter(keyframe_num, dtype=np.int64),
+        )
+        ids = np.full(len(query), -1, dtype=np.int64)
+        if len(self._lookup_key) == 0:
+            return ids
+        pos = np.searchsorted(self._lookup_key, query).clip(0, len(self._lookup_key) - 1)
+        hit = (self._lookup_key[pos] == query) & (prefix_code >= 0)
+        ids[hit] = self._lookup_id[pos[hit]]
+        return ids
+
+    def get_keyframes(
+        self, ids: list[int]
+    ) -> tuple[list[KeyframeInterface], list[int]]:
+        """
+        Returns (keyframes found, in the order of `ids`; keys missing from the store)
+        """
+        ids_arr = np.asarray(ids, dtype=np.int64)
+        found = self.contains(ids_arr)
+        hit_ids = ids_arr[found]
+
+        prefix_code = self.prefix_code[hit_ids]
+        group_num = self.group_num[hit_ids].tolist()
+        video_num = self.video_num[hit_ids].tolist()
+        keyframe_num = self.keyframe_num[hit_ids].tolist()
+
+        keyframes = [
+            KeyframeInterface.model_construct(
+                key=key,
+                video_num=video_num[i],
+                group_num=group_num[i],
+                keyframe_num=keyframe_num[i],
+                prefix=self.prefix_table[prefix_code[i]],
+            )
+            for i, key in enumerate(hit_ids.tolist())
+        ]
+        missing = ids_arr[~found].tolist()
+        return keyframes, missing
@@ -10,57 +10,280 @@ ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../"))
 sys.path.insert(0, ROOT_DIR)
 
 
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import cast
+import numpy as np
 from common.repository import MilvusBaseRepository
-from pymilvus import Collection as MilvusCollection
+from pymilvus import Collection as MilvusCollection, MilvusException, utility
 from pymilvus.client.search_result import SearchResult
+from pymilvus.client.types import LoadState
 from schema.interface import (
     MilvusSearchRequest,
+    MilvusBatchSearchRequest,
     MilvusSearchResult,
     MilvusSearchResponse,
 )
+from utils.milvus_filter import combine_and, compile_id_filter, parse_partition_name
+
+
+SCALAR_METADATA_FIELDS = {"group_num", "video_num", "keyframe_num", "prefix"}
+# load/release có thể do worker khác làm -> hỏi lại Milvus sau mỗi khoảng này
+LOAD_STATE_TTL_SECONDS = 5.0
 
 
 class KeyframeVectorRepository(MilvusBaseRepository):
-    def __init__(self, collection: MilvusCollection, search_params: dict):
+    def __init__(
+        self,
+        collection: MilvusCollection,
+        search_params: dict,
+        search_workers: int = 4,
+    ):
 
         super().__init__(collection)
         self.search_params = search_params
+        field_names = {field.name for field in collection.schema.fields}
+        # collection cũ (chỉ có id + embedding) thì không lọc bằng scalar được
+        self.has_scalar_metadata = SCALAR_METADATA_FIELDS <= field_names
+        # partition theo group ('L21', 'K07', ...) do migration tạo ra
+        self.group_partitions: dict[str, tuple[str, int]] = {}
+        for partition in collection.partitions:
+            parsed = parse_partition_name(partition.name)
+            if parsed is not None:
+                self.group_partitions[partition.name] = parsed
+        # mặc định migration load toàn bộ collection; trạng thái thật lấy từ
+        # Milvus (các uvicorn worker khác có thể load/release partition)
+        self._loaded_partitions: set[str] = set(self.group_partitions)
+        self._load_state_checked = float("-inf")
+        # pymilvus search là blocking gRPC call -> chạy trên executor riêng để
+        # nhiều search (TRAKE stages, nhiều user) chồng lên nhau được
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, search_workers), thread_name_prefix="milvus-search"
+        )
 
-    async def search_by_embedding(self, request: MilvusSearchRequest):
-        expr = None
-        if request.exclude_ids:
-            expr = f"id not in {request.exclude_ids}"
-
-        search_results = cast(
-            SearchResult,
-            self.collection.search(
-                data=[request.embedding],
-                anns_field="embedding",
-                param=self.search_params,
-                limit=request.top_k,
-                expr=expr,
-                output_fields=["id", "embedding"],
-                _async=False,
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    @property
+    def has_group_partitions(self) -> bool:
+        return bool(self.group_partitions)
+
+    @property
+    def loaded_partitions(self) -> list[str]:
+        """Blocking when the cached load state has expired"""
+        self._refresh_loaded_partitions()
+        return sorted(self._loaded_partitions)
+
+    def partitions_for_groups(
+        self,
+        include_groups: list[int] | None = None,
+        exclude_groups: list[int] | None = None,
+    ) -> list[str] | None:
+        """
+        Partition names covering the selected groups, or None when no group
+        constraint applies (or the collection is not partitioned by group).
+        """
+        if not self.group_partitions or not (include_groups or exclude_groups):
+            return None
+        include = set(include_groups or [])
+        exclude = set(exclude_groups or [])
+        return sorted(
+            name
+            for name, (_, group_num) in self.group_partitions.items()
+            if (not include or group_num in include) and group_num not in exclude
+        )
+
+    async def load_partitions(self, partition_names: list[str]) -> list[str]:
+        names = [n for n in partition_names if n in self.group_partitions]
+        if names:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(
+                self._executor,
+                lambda: self.collection.load(partition_names=names),
+            )
+            self._loaded_partitions = self._loaded_partitions | set(names)
+            self._load_state_checked = time.monotonic()
+        return names
+
+    async def release_partitions(self, partition_names: list[str]) -> list[str]:
+        # release idempotent; tập loaded cục bộ có thể cũ nếu worker khác đã load
+        names = [n for n in partition_names if n in self.group_partitions]
+        loop = asyncio.get_running_loop()
+        for name in names:
+            await loop.run_in_executor(
+                self._executor, self.collection.partition(name).release
+            )
+            self._loaded_partitions = self._loaded_partitions - {name}
+        self._load_state_checked = time.monotonic()
+        return names
+
+    def _refresh_loaded_partitions(self, force: bool = False):
+        """Blocking: ask Milvus which group partitions are loaded (cached for a few seconds)"""
+        now = time.monotonic()
+        if not force and now - self._load_state_checked < LOAD_STATE_TTL_SECONDS:
+            return
+        loaded = set()
+        try:
+            for name in self.group_partitions:
+                state = utility.load_state(
+                    self.collection.name, partition_names=[name]
+                )
+                if state == LoadState.Loaded:
+                    loaded.add(name)
+        except MilvusException:
+            return  # giữ trạng thái cũ, lần sau hỏi lại
+        self._loaded_partitions = loaded
+        self._load_state_checked = now
+
+    def _resolve_partitions(self, requested: list[str] | None) -> list[str] | None:
+        """Giới hạn search vào các partition đang được load"""
+        if not self.group_partitions:
+            return requested
+        self._refresh_loaded_partitions()
+        if requested is None:
+            if len(self._loaded_partitions) == len(self.group_partitions):
+                return None
+            return sorted(self._loaded_partitions)
+        return [name for name in requested if name in self._loaded_partitions]
+
+    def _search(
+        self,
+        data: list[list[float]],
+        limit: int,
+        expr: str | None,
+        requested_partitions: list[str] | None,
+        output_fields: list[str],
+    ) -> SearchResult | None:
+        """
+        Blocking search over the loaded partitions; None when none of the
+        requested partitions is loaded. A "not loaded" error (released by
+        another worker since the last check) refreshes the state and retries once.
+        """
+        for attempt in range(2):
+            partition_names = self._resolve_partitions(requested_partitions)
+            if partition_names is not None and not partition_names:
+                return None
+            try:
+                return cast(
+                    SearchResult,
+                    self.collection.search(
+                        data=data,
+                        anns_field="embedding",
+                        param=self.search_params,
+                        limit=limit,
+                        expr=expr,
+                        partition_names=partition_names,
+                        output_fields=output_fields,
+                        _async=False,
+                    ),
+                )
+            except MilvusException as e:
+                if attempt or "not loaded" not in str(e).lower():
+                    raise
+                self._refresh_loaded_partitions(force=True)
+        return None
+
+    async def search_by_embedding(
+        self, request: MilvusSearchRequest
+    ) -> MilvusSearchResponse:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, self._search_by_embedding, request
+        )
+
+    def _search_by_embedding(
+        self, request: MilvusSearchRequest
+    ) -> MilvusSearchResponse:
+        # exclude_ids có thể rất dài -> gom thành các khoảng id liên tiếp
+        expr = combine_and(
+            (
+                compile_id_filter(exclude_ranges=[(i, i) for i in request.exclude_ids])
+                if request.exclude_ids
+                else None
             ),
+            request.filter_expr,
+        )
+
+        # chỉ lấy vector khi được yêu cầu; mặc định Milvus chỉ trả id + distance
+        output_fields = ["embedding"] if request.include_embedding else []
+
+        search_results = self._search(
+            data=[request.embedding],
+            limit=request.top_k,
+            expr=expr,
+            requested_partitions=request.partition_names,
+            output_fields=output_fields,
         )
+        if search_results is None:
+            return MilvusSearchResponse(
+                results=[],
+                total_found=0,
+                embeddings=(
+                    np.empty((0, len(request.embedding)), dtype=np.float32)
+                    if request.include_embedding
+                    else None
+                ),
+            )
 
         results = []
+        vectors = []
         for hits in search_results:
             for hit in hits:
-                result = MilvusSearchResult(
-                    id_=hit.id,
-                    distance=hit.distance,
-                    embedding=(
-                        hit.entity.get("embedding") if hasattr(hit, "entity") else None
-                    ),
-                )
-                results.append(result)
+                results.append(MilvusSearchResult(id_=hit.id, distance=hit.distance))
+                if request.include_embedding:
+                    vectors.append(hit.entity.get("embedding"))
+
+        embeddings = None
+        if request.include_embedding:
+            embeddings = (
+                np.asarray(vectors, dtype=np.float32)
+                if vectors
+                else np.empty((0, len(request.embedding)), dtype=np.float32)
+            )
 
         return MilvusSearchResponse(
             results=results,
             total_found=len(results),
+            embeddings=embeddings,
+        )
+
+    async def search_batch_by_embedding(
+        self, request: MilvusBatchSearchRequest
+    ) -> list[MilvusSearchResponse]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, self._search_batch_by_embedding, request
+        )
+
+    def _search_batch_by_embedding(
+        self, request: MilvusBatchSearchRequest
+    ) -> list[MilvusSearchResponse]:
+        """One Milvus search call with nq = len(request.embeddings)"""
+        search_results = (
+            self._search(
+                data=request.embeddings,
+                limit=request.top_k,
+                expr=request.filter_expr,
+                requested_partitions=request.partition_names,
+                output_fields=[],
+            )
+            if request.embeddings
+            else None
         )
+        if search_results is None:
+            return [
+                MilvusSearchResponse(results=[], total_found=0)
+                for _ in request.embeddings
+            ]
+
+        responses = []
+        for hits in search_results:
+            results = [MilvusSearchResult(id_=hit.id, distance=hit.distance) for hit in hits]
+            responses.append(
+                MilvusSearchResponse(results=results, total_found=len(results))
+            )
+        return responses
 
     def get_all_id(self) -> list[int]:
         return list(range(self.collection.num_entities))
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException
 
-from schema.agent import AgentQueryRequest, AgentQueryResponse
+from schema.agent import AgentQueryRequest, AgentQueryResponse, AgentReloadResponse
 from controller.agent_controller import AgentController
 from core.logger import SimpleLogger
 from core.dependencies import get_agent_controller
@@ -61,3 +61,24 @@ async def agent_search(
     #         status_code=500,
     #         detail=f"Error processing query: {str(e)}"
     #     )
+
+
+@router.post(
+    "/reload",
+    response_model=AgentReloadResponse,
+    summary="Reload the agent's detections and ASR data",
+    description="""
+    Re-read `detections.json`, `asr_proc.json` and the precomputed ASR
+    embeddings from disk and swap them into the shared agent. Use after
+    refreshing the data files; requests already in flight finish with the
+    previous data.
+    """,
+)
+async def agent_reload(
+    controller: AgentController = Depends(get_agent_controller),
+):
+    counts = await controller.reload_data()
+    logger.info(
+        f"Agent data reloaded: {counts['objects']} objects, {counts['asr']} ASR records"
+    )
+    return AgentReloadResponse(**counts)
@@ -8,16 +8,28 @@ from schema.request import (
     TextSearchWithExcludeGroupsRequest,
     TextSearchWithSelectedGroupsAndVideosRequest,
     TrakeSearchRequest,
+    PartitionRequest,
+    BatchSearchRequest,
 )
 from schema.response import (
     KeyframeServiceReponse,
     SingleKeyframeDisplay,
     KeyframeDisplay,
+    BatchKeyframeDisplay,
     TrakeDisplay,
+    TrakeSequence,
     TrakeItem,
+    EmbeddingCacheStats,
+    PartitionStatus,
 )
 from controller.query_controller import QueryController
-from core.dependencies import get_query_controller
+from core.dependencies import (
+    get_query_controller,
+    get_model_service,
+    get_milvus_repository,
+)
+from service import ModelService
+from repository.milvus import KeyframeVectorRepository
 from core.logger import SimpleLogger
 
 
@@ -86,8 +98,7 @@ async def search_keyframes(
         )
     )
     # NEW: export CSV top-100 theo yêu cầu
-    export_path = controller._export_topk_csv(results, k=request.top_k)
-    export_fname = Path(export_path).name
+    export_fname = controller.export_topk_csv(results, k=request.top_k)
     return KeyframeDisplay(results=display_results, export_csv=export_fname)
 
 
@@ -156,8 +167,7 @@ async def search_keyframes_exclude_groups(
         )
     )
 
-    export_path = controller._export_topk_csv(results, k=request.top_k)
-    export_fname = Path(export_path).name
+    export_fname = controller.export_topk_csv(results, k=request.top_k)
     return KeyframeDisplay(results=display_results, export_csv=export_fname)
 
 
@@ -230,32 +240,108 @@ async def search_keyframes_selected_groups_videos(
         )
     )
 
-    export_path = controller._export_topk_csv(results, k=request.top_k)
-    export_fname = Path(export_path).name
+    export_fname = controller.export_topk_csv(results, k=request.top_k)
     return KeyframeDisplay(results=display_results, export_csv=export_fname)
 
 
+@router.post(
+    "/search/batch",
+    response_model=BatchKeyframeDisplay,
+    summary="Run many text searches in one request",
+    description="""
+    Run N text queries, each with its own `top_k`, `score_threshold` and
+    group/video filters, in a single round trip.
+
+    All queries are embedded in one CLIP batch; queries that share the same
+    filter are sent to Milvus together as one multi-vector search, and the
+    metadata of every hit is resolved in one lookup.
+
+    **Example:**
+    ```json
+    {
+        "queries": [
+            {"query": "person walking in the park", "top_k": 100},
+            {"query": "sunset landscape", "top_k": 50, "exclude_groups": [1, 3]},
+            {"query": "car on highway", "include_groups": [2], "include_videos": [5]}
+        ]
+    }
+    ```
+    """,
+    response_description="One result list per query, in request order",
+)
+async def search_keyframes_batch(
+    request: BatchSearchRequest,
+    controller: QueryController = Depends(get_query_controller),
+):
+    logger.info(f"Batch search request: {len(request.queries)} queries")
+
+    batch_results = await controller.search_batch(request.queries)
+
+    displays = []
+    for query, results in zip(request.queries, batch_results):
+        display_results = [
+            SingleKeyframeDisplay(path=path, score=score)
+            for path, score in map(controller.convert_model_to_path, results)
+        ]
+        export_fname = controller.export_topk_csv(results, k=query.top_k)
+        displays.append(
+            KeyframeDisplay(results=display_results, export_csv=export_fname)
+        )
+
+    logger.info(
+        f"Batch search returned {sum(len(r) for r in batch_results)} results "
+        f"for {len(request.queries)} queries"
+    )
+    return BatchKeyframeDisplay(results=displays)
+
+
 @router.post(
     "/trake_search",
     response_model=TrakeDisplay,
-    summary="TRAKE: Retrieval + Alignment using Beam Search",
-    description="Nhận 1-5 sự kiện, trả về 1 keyframe cho mỗi sự kiện, tất cả thuộc cùng 1 video và theo thứ tự thời gian",
+    summary="TRAKE: Retrieval + Alignment",
+    description="Nhận 1-5 sự kiện, trả về 1 keyframe cho mỗi sự kiện, tất cả thuộc cùng 1 video và theo thứ tự thời gian. "
+    "`num_sequences` > 1 trả thêm các chuỗi tốt tiếp theo trong `alternatives`.",
 )
 async def trake_search(
     request: TrakeSearchRequest,
     controller: QueryController = Depends(get_query_controller),
 ):
-    seq = await controller.trake_search(
+    uses_time = request.max_gap_seconds is not None or request.min_gap_seconds > 0
+    if uses_time and controller.frame_index is None:
+        raise HTTPException(
+            status_code=400,
+            detail="max_gap_seconds/min_gap_seconds need the frame index "
+            "(run migration/frame_index_migration.py)",
+        )
+
+    sequences = await controller.trake_search(
         events=request.events,
         top_k=request.top_k,
         score_threshold=request.score_threshold,
         max_kf_gap=request.max_kf_gap,
+        num_sequences=request.num_sequences,
+        one_per_video=request.one_per_video,
+        max_gap_seconds=request.max_gap_seconds,
+        min_gap_seconds=request.min_gap_seconds,
     )
-    if not seq:
+    if not sequences:
         return TrakeDisplay(video_group=-1, video_num=-1, results=[])
 
-    vg = seq[0].group_num
-    vn = seq[0].video_num
+    displays = [_trake_sequence(controller, total, seq) for total, seq in sequences]
+    best = displays[0]
+    return TrakeDisplay(
+        video_group=best.video_group,
+        video_num=best.video_num,
+        results=best.results,
+        export_csv=best.export_csv,
+        total_score=best.total_score,
+        alternatives=displays[1:],
+    )
+
+
+def _trake_sequence(
+    controller: QueryController, total: float, seq: list[KeyframeServiceReponse]
+) -> TrakeSequence:
     items: list[TrakeItem] = []
     for i, kf in enumerate(seq):
         path, score = controller.convert_model_to_path(kf)
@@ -270,24 +356,95 @@ async def trake_search(
             )
         )
 
-    export_path = controller._export_topk_csv(seq, k=len(seq))
-    export_fname = Path(export_path).name
-    return TrakeDisplay(
-        video_group=vg, video_num=vn, results=items, export_csv=export_fname
+    export_fname = controller.export_topk_csv(seq, k=len(seq))
+    return TrakeSequence(
+        video_group=seq[0].group_num,
+        video_num=seq[0].video_num,
+        total_score=total,
+        results=items,
+        export_csv=export_fname,
     )
 
 
 @router.get("/download")
-def download_csv(
+async def download_csv(
     fname: str, controller: QueryController = Depends(get_query_controller)
 ):
-    results_dir = Path(controller.app_settings.RESULT_DIR)
     safe_name = Path(fname).name
-    full = results_dir / safe_name
-    if not full.exists():
+    # export còn pending thì được ghi ngay tại đây
+    full = await controller.export_service.materialize(safe_name)
+    if full is None:
         raise HTTPException(status_code=404, detail="File not found")
     return FileResponse(
         full,
         media_type="text/csv",
         filename=safe_name,
     )
+
+
+@router.get(
+    "/embedding-cache",
+    response_model=EmbeddingCacheStats,
+    summary="Query embedding cache statistics",
+)
+def embedding_cache_stats(
+    model_service: ModelService = Depends(get_model_service),
+):
+    stats = model_service.cache_stats()
+    if stats is None:
+        return EmbeddingCacheStats(enabled=False)
+    return EmbeddingCacheStats(enabled=True, **stats)
+
+
+def _partition_status(
+    repository: KeyframeVectorRepository, changed: list[str] | None = None
+) -> PartitionStatus:
+    return PartitionStatus(
+        partitions=sorted(repository.group_partitions),
+        loaded=repository.loaded_partitions,
+        changed=changed or [],
+    )
+
+
+@router.get(
+    "/partitions",
+    response_model=PartitionStatus,
+    summary="List group partitions and which ones are loaded",
+)
+def list_partitions(
+    repository: KeyframeVectorRepository = Depends(get_milvus_repository),
+):
+    return _partition_status(repository)
+
+
+@router.post(
+    "/partitions/load",
+    response_model=PartitionStatus,
+    summary="Load the partitions of the given groups into memory",
+)
+async def load_partitions(
+    request: PartitionRequest,
+    repository: KeyframeVectorRepository = Depends(get_milvus_repository),
+):
+    names = repository.partitions_for_groups(include_groups=request.groups) or []
+    loaded = await repository.load_partitions(names)
+    logger.info(f"Loaded partitions: {loaded}")
+    return _partition_status(repository, loaded)
+
+
+@router.post(
+    "/partitions/release",
+    response_model=PartitionStatus,
+    summary="Release the partitions of the given groups to free memory",
+    description="""
+    Released groups are skipped by every search until they are loaded again.
+    """,
+)
+async def release_partitions(
+    request: PartitionRequest,
+    repository: KeyframeVectorRepository = Depends(get_milvus_repository),
+):
+    names = repository.partitions_for_groups(include_groups=request.groups) or []
+    released = await repository.release_partitions(names)
+    logger.info(f"Released partitions: {released}")
+    return _partition_status(repository, released)
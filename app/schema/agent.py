@@ -22,3 +22,16 @@ class AgentQueryResponse(BaseModel):
 
     query: str = Field(..., description="Original query")
     answer: str = Field(..., description="Generated answer")
+
+
+class AgentReloadResponse(BaseModel):
+    """Response model for reloading the agent data stores"""
+
+    objects: int = Field(..., description="Number of keyframes with detections")
+    asr: int = Field(..., description="Number of videos with ASR")
+    asr_embeddings: int = Field(
+        default=0, description="Number of videos with precomputed ASR embeddings"
+    )
+    asr_chunks: int = Field(
+        default=0, description="Number of timed ASR chunks mapped to keyframes"
+    )
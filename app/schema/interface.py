@@ -1,5 +1,6 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import List, Optional
+import numpy as np
 
 
 class KeyframeInterface(BaseModel):
@@ -18,6 +19,33 @@ class MilvusSearchRequest(BaseModel):
     exclude_ids: Optional[List[int]] = Field(
         default=None, description="IDs to exclude from search results"
     )
+    filter_expr: Optional[str] = Field(
+        default=None,
+        description="Boolean expression on scalar fields, e.g. 'group_num in [21, 22]'",
+    )
+    partition_names: Optional[List[str]] = Field(
+        default=None,
+        description="Only search these partitions (one per group, e.g. 'L21')",
+    )
+    include_embedding: bool = Field(
+        default=False,
+        description="Also return the stored vectors of the hits (as one array)",
+    )
+
+
+class MilvusBatchSearchRequest(BaseModel):
+    """nq = len(embeddings) vectors sharing one filter, partition set and limit"""
+
+    embeddings: List[List[float]] = Field(..., description="Query embedding vectors")
+    top_k: int = Field(
+        default=10, ge=1, le=1000, description="Number of top results per query"
+    )
+    filter_expr: Optional[str] = Field(
+        default=None, description="Boolean expression applied to every query"
+    )
+    partition_names: Optional[List[str]] = Field(
+        default=None, description="Only search these partitions"
+    )
 
 
 class MilvusSearchResult(BaseModel):
@@ -25,16 +53,20 @@ class MilvusSearchResult(BaseModel):
 
     id_: int = Field(..., description="Primary key of the result")
     distance: float = Field(..., description="Distance/similarity score")
-    embedding: Optional[List[float]] = Field(
-        default=None, description="Original embedding vector"
-    )
 
 
 class MilvusSearchResponse(BaseModel):
     """Response model for vector search"""
 
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
     results: List[MilvusSearchResult] = Field(..., description="Search results")
     total_found: int = Field(..., description="Total number of results found")
     search_time_ms: Optional[float] = Field(
         default=None, description="Search execution time in milliseconds"
     )
+    embeddings: Optional[np.ndarray] = Field(
+        default=None,
+        description="(len(results), D) float32 vectors, row-aligned with results; "
+        "only set when include_embedding was requested",
+    )
@@ -44,6 +44,22 @@ class TextSearchWithSelectedGroupsAndVideosRequest(BaseSearchRequest):
     )
 
 
+class BatchSearchItem(BaseSearchRequest):
+    """One query of a batch search; empty filter lists mean no filtering"""
+
+    include_groups: List[int] = Field(default_factory=list)
+    include_videos: List[int] = Field(default_factory=list)
+    exclude_groups: List[int] = Field(default_factory=list)
+
+
+class BatchSearchRequest(BaseModel):
+    """Many text queries answered with one embedding batch and one Milvus call per filter"""
+
+    queries: List[BatchSearchItem] = Field(
+        ..., min_length=1, max_length=256, description="Queries to run together"
+    )
+
+
 class TrakeSearchRequest(BaseModel):
     """Temporal Retrieval and Alignment of Key Events (TRAKE)"""
 
@@ -59,5 +75,31 @@ class TrakeSearchRequest(BaseModel):
     max_kf_gap: int = Field(
         default=200,
         ge=1,
-        description="Giới hạn chênh lệch keyframes"
+        description="Giới hạn chênh lệch keyframes (bỏ qua khi có max_gap_seconds)"
     )
+    num_sequences: int = Field(
+        default=1,
+        ge=1,
+        le=20,
+        description="Số chuỗi trả về (chuỗi tốt nhất + các phương án thay thế)",
+    )
+    one_per_video: bool = Field(
+        default=False,
+        description="Mỗi video chỉ lấy chuỗi tốt nhất của nó",
+    )
+    max_gap_seconds: Optional[float] = Field(
+        default=None,
+        gt=0,
+        description="Khoảng cách thời gian tối đa (giây, theo pts_time) giữa 2 sự kiện liên tiếp",
+    )
+    min_gap_seconds: float = Field(
+        default=0.0,
+        ge=0,
+        description="Khoảng cách thời gian tối thiểu (giây) giữa 2 sự kiện liên tiếp",
+    )
+
+
+class PartitionRequest(BaseModel):
+    """Groups whose Milvus partitions should be loaded or released"""
+
+    groups: List[int] = Field(..., min_length=1, description="Group IDs, e.g. [21, 22]")
@@ -21,6 +21,12 @@ class KeyframeDisplay(BaseModel):
     export_csv: str | None = None
 
 
+class BatchKeyframeDisplay(BaseModel):
+    results: list[KeyframeDisplay] = Field(
+        ..., description="One result list per query, in request order"
+    )
+
+
 class TrakeItem(BaseModel):
     path: str
     score: float
@@ -30,8 +36,37 @@ class TrakeItem(BaseModel):
     stage_index: int = Field(..., description="Vị trí sự kiện trong chuỗi (0-based)")
 
 
+class TrakeSequence(BaseModel):
+    video_group: int
+    video_num: int
+    total_score: float
+    results: List[TrakeItem]
+    export_csv: str | None = None
+
+
 class TrakeDisplay(BaseModel):
+    """Chuỗi tốt nhất ở top-level, các chuỗi tiếp theo trong `alternatives`"""
+
     video_group: int
     video_num: int
     results: List[TrakeItem]
     export_csv: str | None = None
+    total_score: float | None = None
+    alternatives: List[TrakeSequence] = Field(default_factory=list)
+
+
+class EmbeddingCacheStats(BaseModel):
+    enabled: bool
+    entries: int = 0
+    max_entries: int = 0
+    hits: int = 0
+    misses: int = 0
+    hit_rate: float = 0.0
+
+
+class PartitionStatus(BaseModel):
+    partitions: List[str] = Field(..., description="All group partitions")
+    loaded: List[str] = Field(..., description="Partitions currently loaded")
+    changed: List[str] = Field(
+        default_factory=list, description="Partitions affected by this call"
+    )
@@ -0,0 +1,78 @@
+import asyncio
+from typing import Awaitable, Callable
+
+import numpy as np
+
+
+class EmbeddingBatcher:
+    """
+    Micro-batching front end for text embedding.
+
+    Concurrent `submit` calls are collected for up to `max_wait_ms` (or until
+    `max_batch_size` texts are waiting) and encoded together in one
+    tokenizer + encode_text pass. Each caller gets back its own (1, D) row.
+    """
+
+    def __init__(
+        self,
+        encode_batch: Callable[[list[str]], Awaitable[np.ndarray]],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 3.0,
+    ):
+        self._encode_batch = encode_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+
+        self._pending: list[tuple[str, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    async def submit(self, text: str) -> np.ndarray:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        task = asyncio.ensure_future(self._run_batch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: list[tuple[str, asyncio.Future]]):
+        # cùng một câu query gửi nhiều lần trong cửa sổ thì chỉ encode một lần
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        try:
+            feats = await self._encode_batch(texts)
+        except asyncio.CancelledError:
+            # shutdown huỷ task: không để caller chờ mãi
+            for _, future in batch:
+                if not future.done():
+                    future.cancel()
+            raise
+        except BaseException as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+            return
+
+        row_of = {text: i for i, text in enumerate(texts)}
+        for text, future in batch:
+            if not future.done():
+                i = row_of[text]
+                future.set_result(feats[i : i + 1])
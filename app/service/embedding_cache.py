@@ -0,0 +1,168 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+
+def normalize_query(text: str) -> str:
+    """CLIP's tokenizer lowercases and collapses whitespace, so the cache does too"""
+    return " ".join(text.split()).lower()
+
+
+class EmbeddingCache:
+    """
+    Bounded LRU cache of query embeddings keyed on (MODEL_NAME, normalized text).
+
+    Vectors are stored as float32 rows of shape (D,). When `persist_path` is
+    set, entries are also written to a small SQLite file so the cache survives
+    restarts.
+
+    `get` and `put` only touch memory. The SQLite side is blocking and meant to
+    run off the event loop: `get_persisted` looks up memory misses, and `flush`
+    writes buffered puts in one transaction once `flush_due()` says so (every
+    `flush_every` entries or `flush_interval` seconds).
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        max_entries: int = 10000,
+        persist_path: str | None = None,
+        flush_every: int = 64,
+        flush_interval: float = 2.0,
+    ):
+        self.model_name = model_name
+        self.max_entries = max(1, max_entries)
+        self.hits = 0
+        self.misses = 0
+
+        self._entries: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+
+        # put() chưa ghi xuống SQLite; flush() ghi gộp một commit
+        self.flush_every = max(1, flush_every)
+        self.flush_interval = flush_interval
+        self._unflushed: dict[str, bytes] = {}
+        self._last_flush = time.monotonic()
+        self._db_lock = threading.Lock()
+
+        self._db: sqlite3.Connection | None = None
+        if persist_path:
+            Path(persist_path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(persist_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings "
+                "(key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+            self._db.commit()
+
+    def _key(self, text: str) -> str:
+        return f"{self.model_name}\x00{normalize_query(text)}"
+
+    @property
+    def persistent(self) -> bool:
+        return self._db is not None
+
+    def get(self, text: str) -> np.ndarray | None:
+        """Memory only; a miss is counted here unless the SQLite file is still to be checked"""
+        key = self._key(text)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vector
+            if self._db is None:
+                self.misses += 1
+            return None
+
+    def get_persisted(self, texts: list[str]) -> list[np.ndarray | None]:
+        """Blocking SQLite lookup for texts that missed in memory"""
+        vectors = []
+        for text in texts:
+            key = self._key(text)
+            with self._lock:
+                buffered = self._unflushed.get(key)
+            if buffered is not None:
+                vector = np.frombuffer(buffered, dtype=np.float32)
+            else:
+                vector = self._load_persisted(key)
+            with self._lock:
+                if vector is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                    self._remember(key, vector)
+            vectors.append(vector)
+        return vectors
+
+    def put(self, text: str, vector: np.ndarray):
+        key = self._key(text)
+        vector = np.ascontiguousarray(vector, dtype=np.float32).reshape(-1)
+        vector.setflags(write=False)
+        with self._lock:
+            self._remember(key, vector)
+            if self._db is not None:
+                self._unflushed[key] = vector.tobytes()
+
+    def flush_due(self) -> bool:
+        with self._lock:
+            if not self._unflushed:
+                return False
+            return (
+                len(self._unflushed) >= self.flush_every
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+
+    def flush(self):
+        """Write buffered puts to SQLite in one transaction (blocking)"""
+        with self._lock:
+            rows, self._unflushed = list(self._unflushed.items()), {}
+            self._last_flush = time.monotonic()
+        if not rows:
+            return
+        with self._db_lock:
+            if self._db is None:
+                return
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows
+            )
+            self._db.commit()
+
+    def stats(self) -> dict[str, int | float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    def close(self):
+        self.flush()
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _load_persisted(self, key: str) -> np.ndarray | None:
+        with self._db_lock:
+            if self._db is None:
+                return None
+            row = self._db.execute(
+                "SELECT vector FROM embeddings WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return np.frombuffer(row[0], dtype=np.float32)
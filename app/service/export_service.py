@@ -0,0 +1,192 @@
+import os
+import sys
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../"))
+sys.path.insert(0, ROOT_DIR)
+
+import asyncio
+import csv
+import hashlib
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable
+
+from schema.response import KeyframeServiceReponse
+from core.logger import SimpleLogger
+
+
+logger = SimpleLogger(__name__)
+
+Row = tuple[str, int]
+
+
+class CsvExportService:
+    """
+    Top-k CSV exports, kept out of the request path.
+
+    `submit` only hashes the result set and returns a file name; the file is
+    written by a background worker (when `eager`) or on the first `/download`
+    of that name, whichever comes first. Identical result sets share one file,
+    and the export directory is pruned to `max_files` / `max_age_seconds`.
+
+    Pending exports live in one process. With several uvicorn workers a
+    `/download` may reach a worker that never saw the search, so `materialize`
+    waits up to `wait_seconds` for the file written by the other worker's
+    eager writer.
+    """
+
+    def __init__(
+        self,
+        result_dir: str,
+        build_rows: Callable[[list[KeyframeServiceReponse]], list[Row]],
+        max_files: int = 500,
+        max_age_seconds: float = 24 * 3600,
+        max_pending: int = 1000,
+        eager: bool = True,
+        wait_seconds: float = 10.0,
+    ):
+        self.result_dir = Path(result_dir)
+        self.result_dir.mkdir(parents=True, exist_ok=True)
+        self._build_rows = build_rows
+        self.max_files = max_files
+        self.max_age_seconds = max_age_seconds
+        self.max_pending = max(1, max_pending)
+        self.eager = eager
+        self.wait_seconds = wait_seconds
+
+        # fname -> kết quả chưa ghi ra đĩa
+        self._pending: OrderedDict[str, list[KeyframeServiceReponse]] = OrderedDict()
+        self._writing: dict[str, asyncio.Task] = {}
+        self._queue: asyncio.Queue[str] | None = None
+        self._worker: asyncio.Task | None = None
+
+    @staticmethod
+    def export_name(items: list[KeyframeServiceReponse]) -> str:
+        digest = hashlib.sha1()
+        for kf in items:
+            digest.update(
+                f"{kf.prefix}/{kf.group_num}/{kf.video_num}/{kf.keyframe_num};".encode()
+            )
+        return f"export_{digest.hexdigest()[:20]}.csv"
+
+    def submit(self, items: list[KeyframeServiceReponse], k: int) -> str:
+        """Register an export of items[:k] and return its file name right away"""
+        items = list(items[:k])
+        fname = self.export_name(items)
+
+        path = self.result_dir / fname
+        if path.exists():
+            # giữ file đang được dùng lại khỏi bị retention xoá
+            os.utime(path)
+            return fname
+        if fname in self._pending or fname in self._writing:
+            return fname
+
+        self._pending[fname] = items
+        while len(self._pending) > self.max_pending:
+            dropped, _ = self._pending.popitem(last=False)
+            logger.warning(f"Export queue full, dropped pending export {dropped}")
+
+        if self.eager and self._queue is not None:
+            self._queue.put_nowait(fname)
+        return fname
+
+    async def materialize(self, fname: str) -> Path | None:
+        """Path of the export, writing it first if it is still pending"""
+        fname = Path(fname).name
+        path = self.result_dir / fname
+
+        task = self._writing.get(fname)
+        if task is None:
+            if path.exists():
+                return path
+            items = self._pending.pop(fname, None)
+            if items is None:
+                return await self._wait_for_file(path)
+            task = asyncio.create_task(self._write_async(fname, path, items))
+            self._writing[fname] = task
+            task.add_done_callback(lambda _: self._writing.pop(fname, None))
+
+        await asyncio.shield(task)
+        return path
+
+    async def _wait_for_file(self, path: Path, poll_seconds: float = 0.1) -> Path | None:
+        """Poll for an export another worker is still writing"""
+        deadline = time.monotonic() + self.wait_seconds
+        while time.monotonic() < deadline:
+            await asyncio.sleep(poll_seconds)
+            if path.exists():
+                return path
+        return None
+
+    async def _write_async(
+        self, fname: str, path: Path, items: list[KeyframeServiceReponse]
+    ):
+        try:
+            await asyncio.to_thread(self._write, path, items)
+        except Exception:
+            # lần /download sau sẽ thử ghi lại
+            self._pending.setdefault(fname, items)
+            raise
+
+    def _write(self, path: Path, items: list[KeyframeServiceReponse]):
+        self.write_rows(path, self._build_rows(items))
+        self.prune()
+
+    @staticmethod
+    def write_rows(path: Path, rows: list[Row]):
+        """Write CSV rows (no header) atomically: tmp file + rename"""
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerows(rows)
+        os.replace(tmp_path, path)
+
+    def prune(self) -> int:
+        """Delete CSVs older than max_age_seconds, then the oldest beyond max_files"""
+        files = []
+        for path in self.result_dir.glob("*.csv"):
+            try:
+                files.append((path.stat().st_mtime, path))
+            except FileNotFoundError:
+                continue
+        files.sort(reverse=True)
+
+        now = time.time()
+        removed = 0
+        for rank, (mtime, path) in enumerate(files):
+            too_old = self.max_age_seconds > 0 and now - mtime > self.max_age_seconds
+            too_many = self.max_files > 0 and rank >= self.max_files
+            if too_old or too_many:
+                path.unlink(missing_ok=True)
+                removed += 1
+        return removed
+
+    async def _run_worker(self):
+        while True:
+            fname = await self._queue.get()
+            try:
+                await self.materialize(fname)
+            except Exception as e:
+                logger.error(f"Failed to write export {fname}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def start(self):
+        removed = await asyncio.to_thread(self.prune)
+        if removed:
+            logger.info(f"Removed {removed} expired exports from {self.result_dir}")
+        if self.eager and self._worker is None:
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run_worker())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+            self._queue = None
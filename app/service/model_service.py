@@ -1,23 +1,177 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import torch
 import numpy as np
 
+from .embedding_batcher import EmbeddingBatcher
+from .embedding_cache import EmbeddingCache
+
 
 class ModelService:
-    def __init__(self, model, preprocess, tokenizer, device: str = "cuda"):
+    def __init__(
+        self,
+        model,
+        preprocess,
+        tokenizer,
+        device: str = "cuda",
+        batch_window_ms: float = 3.0,
+        max_batch_size: int = 32,
+        inference_workers: int = 1,
+        torch_threads: int = 0,
+        cache: EmbeddingCache | None = None,
+    ):
         self.model = model
         self.model = model.to(device)
         self.preprocess = preprocess
         self.tokenizer = tokenizer
         self.device = device
         self.model.eval()
+        self.cache = cache
+        self._flush_task: asyncio.Future | None = None
+
+        # Inference chạy trên thread pool riêng để không chặn event loop;
+        # semaphore giới hạn số forward pass chạy cùng lúc
+        inference_workers = max(1, inference_workers)
+        if torch_threads <= 0:
+            torch_threads = max(1, (os.cpu_count() or 1) // inference_workers)
+        self._inference_slots = asyncio.Semaphore(inference_workers)
+        self._executor = ThreadPoolExecutor(
+            max_workers=inference_workers,
+            thread_name_prefix="clip-inference",
+            initializer=self._init_inference_worker,
+            initargs=(torch_threads,),
+        )
+
+        self._batcher = EmbeddingBatcher(
+            encode_batch=self.aembedding_batch,
+            max_batch_size=max_batch_size,
+            max_wait_ms=batch_window_ms,
+        )
+
+    def _init_inference_worker(self, torch_threads: int):
+        if self.device == "cpu":
+            torch.set_num_threads(torch_threads)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self.cache is not None:
+            self.cache.close()
+
+    def cache_stats(self) -> dict[str, int | float] | None:
+        return self.cache.stats() if self.cache is not None else None
+
+    def _cached(self, query_text: str) -> np.ndarray | None:
+        """Blocking lookup (memory, then the SQLite file) for the sync path"""
+        if self.cache is None:
+            return None
+        vector = self.cache.get(query_text)
+        if vector is None and self.cache.persistent:
+            vector = self.cache.get_persisted([query_text])[0]
+        return vector[None, :] if vector is not None else None
+
+    async def _acached_many(self, query_texts: list[str]) -> list[np.ndarray | None]:
+        """Memory lookups inline; SQLite lookups for the misses on a worker thread"""
+        if self.cache is None:
+            return [None] * len(query_texts)
+        vectors = [self.cache.get(t) for t in query_texts]
+        misses = [i for i, v in enumerate(vectors) if v is None]
+        if misses and self.cache.persistent:
+            found = await asyncio.to_thread(
+                self.cache.get_persisted, [query_texts[i] for i in misses]
+            )
+            for i, vector in zip(misses, found):
+                vectors[i] = vector
+        return [v[None, :] if v is not None else None for v in vectors]
+
+    def _remember(self, query_text: str, arr: np.ndarray):
+        if self.cache is None:
+            return
+        self.cache.put(query_text, arr[0])
+        if not self.cache.flush_due():
+            return
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # đường sync (không có event loop): ghi luôn
+            self.cache.flush()
+            return
+        # commit SQLite (fsync) chạy ở thread khác, mỗi lúc tối đa một lần
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(asyncio.to_thread(self.cache.flush))
 
     def embedding(self, query_text: str) -> np.ndarray:
         """
         Return (1, ndim 1024) torch.Tensor
         """
+        cached = self._cached(query_text)
+        if cached is not None:
+            return cached
+        arr = self.embedding_batch([query_text])
+        self._remember(query_text, arr)
+        return arr
+
+    async def aembedding(self, query_text: str) -> np.ndarray:
+        """
+        Same (1, D) output as `embedding`, but concurrent callers are batched
+        into a single forward pass. Cache hits skip the model entirely.
+        """
+        cached = (await self._acached_many([query_text]))[0]
+        if cached is not None:
+            return cached
+        arr = await self._batcher.submit(query_text)
+        self._remember(query_text, arr)
+        return arr
+
+    async def aembedding_many(
+        self, query_texts: list[str], use_cache: bool = True
+    ) -> np.ndarray:
+        """
+        (N, D) for a known list of texts: cache hits are reused and all misses
+        go through the model as one batch. `use_cache=False` for one-off texts
+        (e.g. ASR transcripts) that would only evict real query vectors.
+        """
+        rows: list[np.ndarray | None] = (
+            await self._acached_many(query_texts)
+            if use_cache
+            else [None] * len(query_texts)
+        )
+        missing = list(
+            dict.fromkeys(t for t, row in zip(query_texts, rows) if row is None)
+        )
+        if missing:
+            feats = await self.aembedding_batch(missing)
+            row_of = {}
+            for i, text in enumerate(missing):
+                row_of[text] = feats[i : i + 1]
+                if use_cache:
+                    self._remember(text, row_of[text])
+            rows = [
+                row if row is not None else row_of[t]
+                for t, row in zip(query_texts, rows)
+            ]
+        if not rows:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.concatenate(rows, axis=0)
+
+    async def aembedding_batch(self, query_texts: list[str]) -> np.ndarray:
+        """
+        Run `embedding_batch` on the inference executor, off the event loop
+        """
+        async with self._inference_slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor, self.embedding_batch, query_texts
+            )
+
+    def embedding_batch(self, query_texts: list[str]) -> np.ndarray:
+        """
+        Return (N, D) float32, one L2-normalized row per input text
+        """
         with torch.no_grad():
-            text_tokens = self.tokenizer([query_text]).to(self.device)
-            feats = self.model.encode_text(text_tokens)  # [1, D]
+            text_tokens = self.tokenizer(query_texts).to(self.device)
+            feats = self.model.encode_text(text_tokens)  # [N, D]
             # L2-normalize (phần 3 bên dưới)
             feats = feats / feats.norm(dim=-1, keepdim=True).clamp(min=1e-12)
             arr = feats.cpu().numpy().astype(np.float32)
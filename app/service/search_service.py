@@ -1,17 +1,24 @@
 import os
 import sys
+import asyncio
 
-from typing import List, Tuple
+import numpy as np
+from typing import List
 
 ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../"))
 sys.path.insert(0, ROOT_DIR)
 
 
 from repository.milvus import KeyframeVectorRepository
-from repository.milvus import MilvusSearchRequest
+from repository.milvus import MilvusSearchRequest, MilvusBatchSearchRequest
 from repository.mongo import KeyframeRepository
+from repository.keyframe_store import KeyframeMetadataStore
 
 from schema.response import KeyframeServiceReponse
+from .trake_aligner import TrakeAligner
+from utils.milvus_filter import compile_id_filter
+from utils.id_range_index import IdRangeIndex
+from utils.frame_index import FrameIndex
 
 
 class KeyframeQueryService:
@@ -19,17 +26,40 @@ class KeyframeQueryService:
         self,
         keyframe_vector_repo: KeyframeVectorRepository,
         keyframe_mongo_repo: KeyframeRepository,
+        keyframe_store: KeyframeMetadataStore | None = None,
     ):
 
         self.keyframe_vector_repo = keyframe_vector_repo
         self.keyframe_mongo_repo = keyframe_mongo_repo
+        # metadata tĩnh nằm sẵn trong RAM; Mongo chỉ dùng cho key store không có
+        self.keyframe_store = keyframe_store
+
+    @property
+    def supports_scalar_filter(self) -> bool:
+        """True when the Milvus collection stores group/video/keyframe fields"""
+        return self.keyframe_vector_repo.has_scalar_metadata
+
+    def partitions_for_groups(
+        self,
+        include_groups: list[int] | None = None,
+        exclude_groups: list[int] | None = None,
+    ) -> list[str] | None:
+        return self.keyframe_vector_repo.partitions_for_groups(
+            include_groups, exclude_groups
+        )
 
     async def _retrieve_keyframes(self, ids: list[int]):
-        keyframes = await self.keyframe_mongo_repo.get_keyframe_by_list_of_keys(ids)
-        print(keyframes[:5])
+        if self.keyframe_store is not None:
+            keyframes, missing = self.keyframe_store.get_keyframes(ids)
+            if missing:
+                keyframes += await self.keyframe_mongo_repo.get_keyframe_by_list_of_keys(
+                    missing
+                )
+        else:
+            keyframes = await self.keyframe_mongo_repo.get_keyframe_by_list_of_keys(ids)
 
         keyframe_map = {k.key: k for k in keyframes}
-        return_keyframe = [keyframe_map[k] for k in ids]
+        return_keyframe = [keyframe_map[k] for k in ids if k in keyframe_map]
         return return_keyframe
 
     async def _search_keyframes(
@@ -38,33 +68,42 @@ class KeyframeQueryService:
         top_k: int,
         score_threshold: float | None = None,
         exclude_indices: list[int] | None = None,
+        filter_expr: str | None = None,
+        partition_names: list[str] | None = None,
     ) -> list[KeyframeServiceReponse]:
 
         search_request = MilvusSearchRequest(
-            embedding=text_embedding, top_k=top_k, exclude_ids=exclude_indices
+            embedding=text_embedding,
+            top_k=top_k,
+            exclude_ids=exclude_indices,
+            filter_expr=filter_expr,
+            partition_names=partition_names,
         )
 
         search_response = await self.keyframe_vector_repo.search_by_embedding(
             search_request
         )
 
-        filtered_results = [
-            result
-            for result in search_response.results
-            if score_threshold is None or result.distance > score_threshold
-        ]
-
-        sorted_results = sorted(
-            filtered_results, key=lambda r: r.distance, reverse=True
-        )
-
+        sorted_results = self._filter_and_sort(search_response.results, score_threshold)
         sorted_ids = [result.id_ for result in sorted_results]
 
         keyframes = await self._retrieve_keyframes(sorted_ids)
 
         keyframe_map = {k.key: k for k in keyframes}
-        response = []
+        return self._to_responses(sorted_results, keyframe_map)
 
+    @staticmethod
+    def _filter_and_sort(results, score_threshold: float | None):
+        filtered_results = [
+            result
+            for result in results
+            if score_threshold is None or result.distance > score_threshold
+        ]
+        return sorted(filtered_results, key=lambda r: r.distance, reverse=True)
+
+    @staticmethod
+    def _to_responses(sorted_results, keyframe_map) -> list[KeyframeServiceReponse]:
+        response = []
         for result in sorted_results:
             keyframe = keyframe_map.get(result.id_)
             if keyframe is not None:
@@ -100,16 +139,11 @@ class KeyframeQueryService:
         """
         range_queries: a bunch of start end indices, and we just search inside these, ignore everything
         """
-
-        all_ids = self.keyframe_vector_repo.get_all_id()
-        allowed_ids = set()
-        for start, end in range_queries:
-            allowed_ids.update(range(start, end + 1))
-
-        exclude_ids = [id_ for id_ in all_ids if id_ not in allowed_ids]
-
         return await self._search_keyframes(
-            text_embedding, top_k, score_threshold, exclude_ids
+            text_embedding,
+            top_k,
+            score_threshold,
+            filter_expr=compile_id_filter(include_ranges=range_queries),
         )
 
     async def search_by_text_exclude_ids(
@@ -126,69 +160,197 @@ class KeyframeQueryService:
             text_embedding, top_k, score_threshold, exclude_ids
         )
 
-    async def trake_beam_search(
+    async def search_by_text_filter(
+        self,
+        text_embedding: list[float],
+        top_k: int,
+        score_threshold: float | None,
+        filter_expr: str | None,
+        partition_names: list[str] | None = None,
+    ):
+        """
+        filter_expr: Milvus boolean expression on the scalar metadata fields
+        partition_names: restrict the search to these group partitions
+        """
+        return await self._search_keyframes(
+            text_embedding,
+            top_k,
+            score_threshold,
+            None,
+            filter_expr,
+            partition_names,
+        )
+
+    async def search_batch(
+        self,
+        text_embeddings: list[list[float]],
+        top_ks: list[int],
+        score_thresholds: list[float | None],
+        filter_exprs: list[str | None],
+        partition_names: list[list[str] | None],
+    ) -> list[list[KeyframeServiceReponse]]:
+        """
+        Many queries at once. Queries sharing the same filter/partitions go to
+        Milvus as one nq=N search (limit = the largest top_k of the group, each
+        query is trimmed back afterwards); the metadata of every hit is then
+        resolved in a single lookup.
+        """
+        groups: dict[tuple, list[int]] = {}
+        for i, (expr, parts) in enumerate(zip(filter_exprs, partition_names)):
+            key = (expr, tuple(parts) if parts is not None else None)
+            groups.setdefault(key, []).append(i)
+
+        async def run_group(key: tuple, members: list[int]):
+            expr, parts = key
+            responses = await self.keyframe_vector_repo.search_batch_by_embedding(
+                MilvusBatchSearchRequest(
+                    embeddings=[text_embeddings[i] for i in members],
+                    top_k=max(top_ks[i] for i in members),
+                    filter_expr=expr,
+                    partition_names=list(parts) if parts is not None else None,
+                )
+            )
+            return members, responses
+
+        per_query: list[list] = [[] for _ in text_embeddings]
+        for members, responses in await asyncio.gather(
+            *(run_group(key, members) for key, members in groups.items())
+        ):
+            for i, response in zip(members, responses):
+                per_query[i] = self._filter_and_sort(
+                    response.results, score_thresholds[i]
+                )[: top_ks[i]]
+
+        all_ids = list(dict.fromkeys(r.id_ for results in per_query for r in results))
+        keyframes = await self._retrieve_keyframes(all_ids)
+        keyframe_map = {k.key: k for k in keyframes}
+        return [self._to_responses(results, keyframe_map) for results in per_query]
+
+    async def trake_align_search(
         self,
         stage_embeddings: List[List[float]],
-        beam_width: int = 50,
+        candidates_per_stage: int = 200,
         score_threshold: float = 0.0,
         max_kf_gap: int = 200,
-    ) -> List[KeyframeServiceReponse]:
+        id_ranges: IdRangeIndex | None = None,
+        num_sequences: int = 1,
+        one_per_video: bool = False,
+        max_gap_seconds: float | None = None,
+        min_gap_seconds: float = 0.0,
+        frame_index: FrameIndex | None = None,
+    ) -> list[tuple[float, List[KeyframeServiceReponse]]]:
         """
-        Beam search qua chuỗi sự kiện:
-        - Giai đoạn 1: lấy top-k keyframe
-        - Các giai đoạn sau: chỉ giữ ứng viên cùng video với phần tử trước,
-          keyframe_num tăng dần và chênh lệch <= max_kf_gap.
-        Trả về chuỗi keyframe tốt nhất (1 phần tử cho mỗi sự kiện).
+        TRAKE qua chuỗi sự kiện:
+        - Stage 1: search toàn bộ, lấy top `candidates_per_stage` keyframe
+        - Stage 2..n: gửi chung một search nq=n-1, chỉ trong cửa sổ id sau các
+          ứng viên stage 1 (id + 1 .. id + (n-1) * max_kf_gap, cắt theo khoảng
+          id của video) và partition của các group đó; metadata của mọi hit
+          được lấy trong một lần
+        - TrakeAligner chọn chuỗi tối ưu (chính xác, không phải beam): cùng video,
+          keyframe_num tăng dần và chênh lệch <= max_kf_gap; có frame_index thì
+          thêm điều kiện min_gap_seconds <= Δpts_time <= max_gap_seconds.
+          Khi có max_gap_seconds, giới hạn thời gian thay hẳn max_kf_gap: aligner
+          bỏ giới hạn số keyframe và cửa sổ id của stage sau chỉ tính theo
+          pts_time (t + min_gap .. t + (n-1) * max_gap trong video).
+        Trả về tối đa `num_sequences` chuỗi (tổng điểm, 1 keyframe cho mỗi sự
+        kiện), tốt nhất trước; `one_per_video` thì mỗi video chỉ một chuỗi.
         """
         if not stage_embeddings:
             return []
 
-        # stage 1
+        # khoảng thời gian tối đa thay cho giới hạn số keyframe (cần biết video
+        # của ứng viên để tính cửa sổ id)
+        time_bounded = (
+            max_gap_seconds is not None
+            and frame_index is not None
+            and id_ranges is not None
+        )
+        aligner = TrakeAligner(
+            max_kf_gap=None if time_bounded else max_kf_gap,
+            max_gap_seconds=max_gap_seconds,
+            min_gap_seconds=min_gap_seconds,
+            pts_time_of=frame_index.pts_time_of if frame_index is not None else None,
+        )
         first = await self._search_keyframes(
             text_embedding=stage_embeddings[0],
-            top_k=min(beam_width, 100),
+            top_k=candidates_per_stage,
             score_threshold=score_threshold,
-            exclude_indices=None,
         )
         if not first:
             return []
 
-        # beam = [(tổng_điểm, [seq])]
-        beams: List[Tuple[float, List[KeyframeServiceReponse]]] = [
-            (r.confidence_score, [r]) for r in first
-        ]
+        stage_candidates = [first]
+        later = stage_embeddings[1:]
+        if later:
+            if time_bounded:
+                windows = self._time_windows(
+                    first, id_ranges, frame_index, aligner, len(later)
+                )
+            else:
+                # cửa sổ đủ rộng cho cả chuỗi còn lại
+                horizon = TrakeAligner(max_kf_gap=max_kf_gap * len(later))
+                windows = self._clip_windows(
+                    first, horizon.continuation_windows(first), id_ranges
+                )
+            filter_expr = compile_id_filter(include_ranges=windows)
+            partitions = self.partitions_for_groups(
+                include_groups=sorted({c.group_num for c in first})
+            )
+            stage_candidates += await self.search_batch(
+                text_embeddings=later,
+                top_ks=[candidates_per_stage] * len(later),
+                score_thresholds=[score_threshold] * len(later),
+                filter_exprs=[filter_expr] * len(later),
+                partition_names=[partitions] * len(later),
+            )
+
+        return aligner.align(
+            stage_candidates, k=num_sequences, one_per_video=one_per_video
+        )
 
-        # các stage tiếp theo
-        for s in range(1, len(stage_embeddings)):
-            emb = stage_embeddings[s]
-            # mở rộng ứng viên rộng hơn trước khi lọc
-            candidates = await self._search_keyframes(
-                text_embedding=emb,
-                top_k=min(beam_width * 20, 200),
-                score_threshold=score_threshold,
-                exclude_indices=None,
+    @staticmethod
+    def _time_windows(
+        first: list[KeyframeServiceReponse],
+        id_ranges: IdRangeIndex,
+        frame_index: FrameIndex,
+        aligner: TrakeAligner,
+        n_later: int,
+    ) -> list[tuple[int, int]]:
+        """
+        Cửa sổ id theo pts_time trong video của từng ứng viên:
+        [t + min_gap, t + n_later * max_gap], không phụ thuộc max_kf_gap
+        """
+        pts = frame_index.pts_time_of([c.key for c in first])
+        windows = []
+        for c, t in zip(first, pts.tolist()):
+            video_range = id_ranges.range_of(c.group_num, c.video_num, c.key)
+            if video_range is None or np.isnan(t):  # không có pts_time
+                continue
+            window = frame_index.time_window(
+                key=c.key,
+                video_start=video_range[0],
+                video_end=video_range[1],
+                t_from=t + aligner.min_gap_seconds,
+                t_to=t + n_later * aligner.max_gap_seconds,
             )
-            next_beams: List[Tuple[float, List[KeyframeServiceReponse]]] = []
-
-            for total, seq in beams:
-                last = seq[-1]
-                for c in candidates:
-                    if (c.group_num != last.group_num) or (
-                        c.video_num != last.video_num
-                    ):
-                        continue
-                    if int(c.keyframe_num) <= int(last.keyframe_num):
-                        continue
-                    if int(c.keyframe_num) - int(last.keyframe_num) > max_kf_gap:
-                        continue
-                    next_beams.append((total + c.confidence_score, seq + [c]))
-
-            # giữ lại beam tốt nhất
-            next_beams.sort(key=lambda x: x[0], reverse=True)
-            beams = next_beams[:beam_width]
-            if not beams:
-                return []
-
-        # chọn best
-        _, best_seq = max(beams, key=lambda x: x[0])
-        return best_seq
+            if window is not None:
+                windows.append(window)
+        return windows
+
+    @staticmethod
+    def _clip_windows(
+        live: list[KeyframeServiceReponse],
+        windows: list[tuple[int, int]],
+        id_ranges: IdRangeIndex | None,
+    ) -> list[tuple[int, int]]:
+        """Không để cửa sổ tràn sang video kế tiếp"""
+        if id_ranges is None:
+            return windows
+        clipped = []
+        for c, (start, end) in zip(live, windows):
+            video_range = id_ranges.range_of(c.group_num, c.video_num, c.key)
+            if video_range is not None:
+                end = min(end, video_range[1])
+            if start <= end:
+                clipped.append((start, end))
+        return clipped
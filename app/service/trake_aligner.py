@@ -0,0 +1,172 @@
+import os
+import sys
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../"))
+sys.path.insert(0, ROOT_DIR)
+
+from collections import defaultdict
+from typing import Callable
+
+import numpy as np
+
+from schema.response import KeyframeServiceReponse
+
+
+VideoKey = tuple[str, int, int]
+
+
+class TrakeAligner:
+    """
+    Exact TRAKE alignment by dynamic programming.
+
+    Given one candidate list per event, find the chain c_1..c_n (one candidate
+    per event) inside a single video with strictly increasing keyframe_num,
+    consecutive gaps <= max_kf_gap, and the highest total confidence score.
+
+    Candidates are grouped per (prefix, group, video); within a video each
+    stage is a max-plus step over a (n_stage, n_prev) gap-mask matrix:
+
+        best_s[j] = score_s[j] + max_i { best_{s-1}[i] : 0 < kf_s[j] - kf_{s-1}[i] <= gap }
+
+    For k-best, each candidate keeps its k best chain scores and the max
+    becomes a top-k over (previous candidate, rank) pairs.
+
+    With `pts_time_of` (keyframe ids -> seconds, NaN if unknown), transitions
+    must also satisfy min_gap_seconds <= dt <= max_gap_seconds; keyframes
+    without a timestamp cannot be chained. `max_kf_gap=None` drops the
+    keyframe-count limit so that the time gap alone bounds a transition.
+    """
+
+    def __init__(
+        self,
+        max_kf_gap: int | None = 200,
+        max_gap_seconds: float | None = None,
+        min_gap_seconds: float = 0.0,
+        pts_time_of: Callable[[np.ndarray], np.ndarray] | None = None,
+    ):
+        self.max_kf_gap = max_kf_gap
+        self.max_gap_seconds = max_gap_seconds
+        self.min_gap_seconds = min_gap_seconds
+        self.pts_time_of = pts_time_of
+
+    @property
+    def uses_time(self) -> bool:
+        return self.pts_time_of is not None and (
+            self.max_gap_seconds is not None or self.min_gap_seconds > 0
+        )
+
+    @staticmethod
+    def _group_by_video(
+        stage_candidates: list[list[KeyframeServiceReponse]],
+    ) -> dict[VideoKey, list[list[KeyframeServiceReponse]]]:
+        videos: dict[VideoKey, list[list[KeyframeServiceReponse]]] = defaultdict(
+            lambda: [[] for _ in stage_candidates]
+        )
+        for s, candidates in enumerate(stage_candidates):
+            for c in candidates:
+                videos[(c.prefix, c.group_num, c.video_num)][s].append(c)
+        return videos
+
+    def _forward(
+        self, stages: list[list[KeyframeServiceReponse]], k: int
+    ) -> tuple[np.ndarray, list[np.ndarray]]:
+        """
+        k best chain scores ending at each last-stage candidate, shape (n, k),
+        -inf where fewer chains exist; backpointers hold prev_index * k + prev_rank
+        """
+        kf = [np.array([c.keyframe_num for c in cands], dtype=np.int64) for cands in stages]
+        score = [
+            np.array([c.confidence_score for c in cands], dtype=np.float64)
+            for cands in stages
+        ]
+        if self.uses_time:
+            pts = [
+                self.pts_time_of(np.array([c.key for c in cands], dtype=np.int64))
+                for cands in stages
+            ]
+
+        best = np.full((len(score[0]), k), -np.inf)
+        best[:, 0] = score[0]
+        backpointers: list[np.ndarray] = []
+        for s in range(1, len(stages)):
+            gap = kf[s][:, None] - kf[s - 1][None, :]  # (n_s, n_prev)
+            valid = gap > 0
+            if self.max_kf_gap is not None:
+                valid &= gap <= self.max_kf_gap
+            if self.uses_time:
+                # NaN so sánh luôn False -> keyframe thiếu pts_time bị loại
+                dt = pts[s][:, None] - pts[s - 1][None, :]
+                valid &= dt >= self.min_gap_seconds
+                if self.max_gap_seconds is not None:
+                    valid &= dt <= self.max_gap_seconds
+            # (n_s, n_prev * k): mọi cách nối từ k chuỗi tốt nhất của từng ứng viên trước
+            chained = np.where(valid[:, :, None], best[None, :, :], -np.inf).reshape(
+                len(score[s]), -1
+            )
+            kk = min(k, chained.shape[1])
+            top = np.argsort(-chained, axis=1, kind="stable")[:, :kk]
+
+            best = np.full((len(score[s]), k), -np.inf)
+            best[:, :kk] = score[s][:, None] + np.take_along_axis(chained, top, axis=1)
+            back = np.full((len(score[s]), k), -1, dtype=np.int64)
+            back[:, :kk] = top
+            backpointers.append(back)
+            if not np.isfinite(best).any():
+                break
+        return best, backpointers
+
+    def _align_video(
+        self, stages: list[list[KeyframeServiceReponse]], k: int
+    ) -> list[tuple[float, list[int]]]:
+        """Up to k best (total score, candidate index per stage) inside one video"""
+        best, backpointers = self._forward(stages, k)
+        if len(backpointers) < len(stages) - 1:
+            return []
+
+        flat = best.reshape(-1)
+        order = np.argsort(-flat, kind="stable")[:k]
+        chains = []
+        for end in order.tolist():
+            if not np.isfinite(flat[end]):
+                break
+            j, r = divmod(end, k)
+            path = [j]
+            for back in reversed(backpointers):
+                j, r = divmod(int(back[j, r]), k)
+                path.append(j)
+            path.reverse()
+            chains.append((float(flat[end]), path))
+        return chains
+
+    def continuation_windows(
+        self, live: list[KeyframeServiceReponse]
+    ) -> list[tuple[int, int]]:
+        """
+        Id windows that can hold the next event after each candidate. Ids are
+        contiguous per video and keyframe_num strictly increases with the id,
+        so a keyframe_num gap <= max_kf_gap implies an id gap <= max_kf_gap.
+        """
+        return [(c.key + 1, c.key + self.max_kf_gap) for c in live]
+
+    def align(
+        self,
+        stage_candidates: list[list[KeyframeServiceReponse]],
+        k: int = 1,
+        one_per_video: bool = False,
+    ) -> list[tuple[float, list[KeyframeServiceReponse]]]:
+        """
+        Up to k distinct chains as (total score, one keyframe per event), best
+        first. With one_per_video, only the best chain of each video competes.
+        """
+        if not stage_candidates or any(not c for c in stage_candidates):
+            return []
+
+        chains: list[tuple[float, list[KeyframeServiceReponse]]] = []
+        for stages in self._group_by_video(stage_candidates).values():
+            if any(not cands for cands in stages):
+                continue
+            for total, path in self._align_video(stages, 1 if one_per_video else k):
+                chains.append((total, [stages[s][j] for s, j in enumerate(path)]))
+
+        chains.sort(key=lambda chain: chain[0], reverse=True)
+        return chains[:k]
@@ -0,0 +1,276 @@
+"""
+Per-video and per-chunk ASR embeddings, computed offline by
+migration/asr_embedding_migration.py.
+
+Each video's transcript is split into word chunks whose tokenizer token count
+fits CLIP's 77-token context (ASR syllables often cost several BPE tokens, so
+word counts are not enough), every chunk is embedded, and the L2-normalized mean of the
+chunk vectors becomes the video's row. Rows live in one memory-mapped matrix
+(utils/columnar.py), so scoring all candidate videos against a query is a
+single matrix-vector product. The chunks themselves are kept too, with time
+windows and a keyframe id -> chunk mapping (AsrChunkIndex), so the transcript
+segment around a keyframe can be looked up directly.
+"""
+
+import os
+import sys
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../"))
+sys.path.insert(0, ROOT_DIR)
+
+from typing import Callable, NamedTuple
+
+import numpy as np
+
+from utils.columnar import read_columns, write_columns
+
+
+def asr_text_of(record: str | dict | None) -> str:
+    """asr_proc.json value -> transcript ('asr_clean' preferred over 'asr_raw')"""
+    if isinstance(record, dict):
+        return (record.get("asr_clean") or record.get("asr_raw") or "").strip()
+    if isinstance(record, str):
+        return record.strip()
+    return ""
+
+
+def asr_video_key(name: str) -> str:
+    """'L21_V001.mp4' -> 'L21_V001'"""
+    return os.path.splitext(name)[0]
+
+
+TOKEN_BUDGET = 75  # context 77 của CLIP trừ token <start>/<end>
+
+
+def token_windows(
+    token_counts: list[int], max_tokens: int = TOKEN_BUDGET, overlap: int = 10
+) -> list[tuple[int, int]]:
+    """
+    Word spans [i, j) whose summed token count stays within `max_tokens`;
+    consecutive spans share up to `overlap` words (at most half a span).
+    A single word over the budget becomes its own span.
+    """
+    spans: list[tuple[int, int]] = []
+    n, start = len(token_counts), 0
+    while start < n:
+        end, used = start, 0
+        while end < n and (end == start or used + token_counts[end] <= max_tokens):
+            used += token_counts[end]
+            end += 1
+        spans.append((start, end))
+        if end >= n:
+            break
+        start = max(start + 1, end - min(overlap, (end - start) // 2))
+    return spans
+
+
+class AsrEmbeddingIndex:
+    def __init__(self, columns: dict[str, np.ndarray], meta: dict):
+        self.embeddings = columns["embeddings"]  # (V, D) float32, L2-normalized
+        self.num_chunks = columns["num_chunks"]
+        self.video_keys: list[str] = meta["video_keys"]
+        self.model_name: str | None = meta.get("model_name")
+        self._row_of = {key: row for row, key in enumerate(self.video_keys)}
+
+    def __len__(self) -> int:
+        return len(self.video_keys)
+
+    @classmethod
+    def open(cls, path: str) -> "AsrEmbeddingIndex":
+        columns, meta = read_columns(path, mmap=True)
+        return cls(columns, meta)
+
+    @staticmethod
+    def save(
+        path: str,
+        video_keys: list[str],
+        embeddings: np.ndarray,
+        num_chunks: np.ndarray,
+        model_name: str,
+    ):
+        write_columns(
+            path,
+            {
+                "embeddings": np.asarray(embeddings, dtype=np.float32),
+                "num_chunks": np.asarray(num_chunks, dtype=np.int32),
+            },
+            {"video_keys": list(video_keys), "model_name": model_name},
+        )
+
+    def similarities(
+        self, query: np.ndarray, video_keys: list[str]
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Cosine similarity of `query` (D,) with each video's ASR row.
+        Returns (similarities, found mask); similarity is 0 where not found.
+        """
+        rows = np.array([self._row_of.get(key, -1) for key in video_keys], dtype=np.int64)
+        found = rows >= 0
+        sims = np.zeros(len(video_keys), dtype=np.float32)
+        if found.any():
+            query = np.asarray(query, dtype=np.float32).reshape(-1)
+            query = query / (np.linalg.norm(query) + 1e-8)
+            sims[found] = self.embeddings[rows[found]] @ query
+        return sims, found
+
+
+# ---- time-windowed ASR chunks ---------------------------------------------
+
+AsrChunk = tuple[float, float, str]  # (start giây, end giây, text)
+
+
+class AsrSegment(NamedTuple):
+    text: str
+    start: float
+    end: float
+    score: float
+
+
+def asr_segments_of(record: str | dict | None) -> list[AsrChunk]:
+    """Whisper-style record["segments"] = [{start, end, text}, ...], if present"""
+    if not isinstance(record, dict):
+        return []
+    segments = []
+    for seg in record.get("segments") or []:
+        try:
+            text = str(seg.get("text", "")).strip()
+            if text:
+                segments.append((float(seg["start"]), float(seg["end"]), text))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            continue
+    return segments
+
+
+def time_chunks(
+    record: str | dict | None,
+    duration: float | None,
+    count_tokens: Callable[[str], int],
+    max_tokens: int = TOKEN_BUDGET,
+    overlap: int = 10,
+) -> list[AsrChunk]:
+    """
+    Transcript -> (start, end, text) windows of at most `max_tokens` tokens
+    (`count_tokens` counts one word with the text encoder's tokenizer). Word
+    times are spread evenly inside each segment when the record has segment
+    timestamps, so long segments are split too; otherwise they are spread over
+    `duration` (NaN times when it is unknown).
+    """
+    words: list[str] = []
+    word_start: list[float] = []
+    word_end: list[float] = []
+    segments = asr_segments_of(record)
+    if not segments:
+        text_words = asr_text_of(record).split()
+        span = duration if duration else float("nan")
+        segments = [(0.0, span, " ".join(text_words))] if text_words else []
+    for seg_start, seg_end, text in segments:
+        seg_words = text.split()
+        step = (seg_end - seg_start) / len(seg_words)
+        for i, word in enumerate(seg_words):
+            words.append(word)
+            word_start.append(seg_start + i * step)
+            word_end.append(seg_start + (i + 1) * step)
+
+    spans = token_windows([count_tokens(w) for w in words], max_tokens, overlap)
+    return [
+        (word_start[i], word_end[j - 1], " ".join(words[i:j])) for i, j in spans
+    ]
+
+
+class AsrChunkIndex:
+    """
+    Embedded ASR chunks plus, for every keyframe id, the chunk whose time
+    window is closest to the keyframe's pts_time (-1 if none).
+    """
+
+    def __init__(self, columns: dict[str, np.ndarray], meta: dict):
+        self.embeddings = columns["embeddings"]  # (C, D) float32, L2-normalized
+        self.chunk_video = columns["chunk_video"]
+        self.start = columns["start"]
+        self.end = columns["end"]
+        self.keyframe_chunk = columns["keyframe_chunk"]
+        self._text_offsets = columns["text_offsets"]
+        self._text_bytes = columns["text_bytes"]
+        self.video_keys: list[str] = meta["video_keys"]
+        self.model_name: str | None = meta.get("model_name")
+
+    def __len__(self) -> int:
+        return len(self.chunk_video)
+
+    @classmethod
+    def open(cls, path: str) -> "AsrChunkIndex":
+        columns, meta = read_columns(path, mmap=True)
+        return cls(columns, meta)
+
+    @staticmethod
+    def save(
+        path: str,
+        video_keys: list[str],
+        chunk_video: np.ndarray,
+        chunks: list[AsrChunk],
+        embeddings: np.ndarray,
+        keyframe_chunk: np.ndarray,
+        model_name: str,
+    ):
+        encoded = [text.encode("utf-8") for _, _, text in chunks]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+        write_columns(
+            path,
+            {
+                "embeddings": np.asarray(embeddings, dtype=np.float32),
+                "chunk_video": np.asarray(chunk_video, dtype=np.int32),
+                "start": np.array([c[0] for c in chunks], dtype=np.float32),
+                "end": np.array([c[1] for c in chunks], dtype=np.float32),
+                "keyframe_chunk": np.asarray(keyframe_chunk, dtype=np.int32),
+                "text_offsets": offsets,
+                "text_bytes": np.frombuffer(b"".join(encoded), dtype=np.uint8),
+            },
+            {"video_keys": list(video_keys), "model_name": model_name},
+        )
+
+    def text(self, chunk: int) -> str:
+        lo, hi = int(self._text_offsets[chunk]), int(self._text_offsets[chunk + 1])
+        return bytes(self._text_bytes[lo:hi]).decode("utf-8")
+
+    def best_segments(
+        self, ids: list[int], query: np.ndarray, radius: int = 1
+    ) -> list[AsrSegment | None]:
+        """
+        For each keyframe id, the best-matching chunk among the one aligned
+        with its pts_time and `radius` neighbours on each side (same video).
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        n_chunks = len(self.chunk_video)
+        center = np.full(len(ids), -1, dtype=np.int64)
+        valid = (ids >= 0) & (ids < len(self.keyframe_chunk))
+        center[valid] = self.keyframe_chunk[ids[valid]]
+        if n_chunks == 0 or not (center >= 0).any():
+            return [None] * len(ids)
+
+        cand = center[:, None] + np.arange(-radius, radius + 1)[None, :]
+        safe = cand.clip(0, n_chunks - 1)
+        ok = (center[:, None] >= 0) & (cand >= 0) & (cand < n_chunks)
+        ok &= self.chunk_video[safe] == self.chunk_video[center.clip(0)][:, None]
+
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        query = query / (np.linalg.norm(query) + 1e-8)
+        sims = np.full(cand.shape, -np.inf, dtype=np.float32)
+        sims[ok] = self.embeddings[safe[ok]] @ query
+
+        best = sims.argmax(axis=1)
+        segments: list[AsrSegment | None] = []
+        for i, j in enumerate(best.tolist()):
+            if not ok[i, j]:
+                segments.append(None)
+                continue
+            c = int(safe[i, j])
+            segments.append(
+                AsrSegment(
+                    text=self.text(c),
+                    start=float(self.start[c]),
+                    end=float(self.end[c]),
+                    score=float(sims[i, j]),
+                )
+            )
+        return segments
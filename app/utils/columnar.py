@@ -0,0 +1,97 @@
+"""
+Single-file columnar format for static lookup tables.
+
+Layout:
+    8 bytes   magic b"KFCOL\\x00\\x01\\x00"
+    8 bytes   little-endian uint64, length of the JSON header
+    N bytes   JSON header: {"columns": [{name, dtype, shape, offset}], "meta": {...}}
+    ...       column data, each column starting on a 64-byte boundary
+
+Columns are read back with np.memmap, so opening a table is O(1) and only the
+pages that are actually looked up get read from disk.
+"""
+
+import json
+import os
+import struct
+from typing import Any
+
+import numpy as np
+
+
+MAGIC = b"KFCOL\x00\x01\x00"
+_ALIGN = 64
+
+
+def _align(offset: int) -> int:
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def write_columns(
+    path: str,
+    columns: dict[str, np.ndarray],
+    meta: dict[str, Any] | None = None,
+):
+    """Write `columns` atomically (tmp file + rename)."""
+    arrays = {name: np.ascontiguousarray(arr) for name, arr in columns.items()}
+
+    # offset của cột tính từ đầu vùng data; header có độ dài thay đổi nên ghi sau
+    specs, cursor = [], 0
+    for name, arr in arrays.items():
+        cursor = _align(cursor)
+        specs.append(
+            {
+                "name": name,
+                "dtype": arr.dtype.str,
+                "shape": list(arr.shape),
+                "offset": cursor,
+            }
+        )
+        cursor += arr.nbytes
+
+    header = json.dumps({"columns": specs, "meta": meta or {}}).encode("utf-8")
+    data_start = _align(len(MAGIC) + 8 + len(header))
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        for spec, arr in zip(specs, arrays.values()):
+            f.seek(data_start + spec["offset"])
+            f.write(arr.tobytes())
+        f.truncate(data_start + _align(cursor))
+    os.replace(tmp_path, path)
+
+
+def read_columns(
+    path: str, mmap: bool = True
+) -> tuple[dict[str, np.ndarray], dict[str, Any]]:
+    """Returns (columns, meta). Memory-mapped columns are read-only."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a columnar table")
+        (header_len,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_len).decode("utf-8"))
+    data_start = _align(len(MAGIC) + 8 + header_len)
+
+    columns: dict[str, np.ndarray] = {}
+    for spec in header["columns"]:
+        dtype = np.dtype(spec["dtype"])
+        shape = tuple(spec["shape"])
+        offset = data_start + spec["offset"]
+        if int(np.prod(shape)) == 0:
+            columns[spec["name"]] = np.empty(shape, dtype=dtype)
+        elif mmap:
+            columns[spec["name"]] = np.memmap(
+                path, dtype=dtype, mode="r", offset=offset, shape=shape
+            )
+        else:
+            count = int(np.prod(shape))
+            with open(path, "rb") as f:
+                f.seek(offset)
+                columns[spec["name"]] = np.fromfile(
+                    f, dtype=dtype, count=count
+                ).reshape(shape)
+    return columns, header["meta"]
@@ -0,0 +1,174 @@
+"""
+Memory-mapped COCO detections, replacing the detections.json dict.
+
+CSR layout indexed by keyframe id: the detections of keyframe `k` are
+class_ids[offsets[k]:offsets[k + 1]] (uint8 into `class_names`), with
+float16 confidences alongside when the source had scores. Built by
+migration/detection_store_migration.py; every worker maps the same file
+instead of holding its own dict of path strings.
+"""
+
+import os
+import sys
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../"))
+sys.path.insert(0, ROOT_DIR)
+
+import numpy as np
+
+from repository.keyframe_store import KeyframeMetadataStore
+from utils.columnar import read_columns, write_columns
+from utils.object_index import ObjectIndex, parse_detection, parse_detection_key
+
+
+MAX_CLASSES = 256  # class id lưu bằng uint8
+
+
+class DetectionStore:
+    def __init__(self, columns: dict[str, np.ndarray], meta: dict):
+        self.offsets = columns["offsets"]  # (N + 1,) int64
+        self.class_ids = columns["class_ids"]  # uint8
+        self.confidences = columns.get("confidences")  # float16 hoặc None
+        # (prefix, group, video, keyframe_num) đã pack + sort -> keyframe id
+        self._lookup_key = columns["lookup_key"]
+        self._lookup_id = columns["lookup_id"]
+
+        self.class_names: list[str] = meta["class_names"]
+        self.prefix_table: list[str] = meta["prefix_table"]
+        self._prefix_code = {p: i for i, p in enumerate(self.prefix_table)}
+
+    def __len__(self) -> int:
+        """Number of keyframes with at least one detection"""
+        return len(self._lookup_id)
+
+    @property
+    def size(self) -> int:
+        """Largest keyframe id + 1"""
+        return len(self.offsets) - 1
+
+    @classmethod
+    def open(cls, path: str) -> "DetectionStore":
+        columns, meta = read_columns(path, mmap=True)
+        return cls(columns, meta)
+
+    @staticmethod
+    def build(
+        objects_data: dict[str, list],
+        keyframe_store: KeyframeMetadataStore,
+    ) -> tuple[dict[str, np.ndarray], dict]:
+        """
+        detections.json ("Lxx/Lxx_Vyyy/nnn.jpg" -> [detection, ...]) -> (columns,
+        meta) for write_columns. Keyframes unknown to the store are dropped.
+        """
+        parsed = [(parse_detection_key(key), objs) for key, objs in objects_data.items()]
+        parsed = [(p, objs) for p, objs in parsed if p is not None and objs]
+        keyframe_ids = keyframe_store.lookup_ids(
+            [p[0] for p, _ in parsed],
+            (p[1] for p, _ in parsed),
+            (p[2] for p, _ in parsed),
+            (p[3] for p, _ in parsed),
+        )
+
+        class_of: dict[str, int] = {}
+        owner, class_ids, scores = [], [], []
+        kept = []
+        for key, (p, objs) in zip(keyframe_ids.tolist(), parsed):
+            if key < 0:
+                continue
+            detections = [d for d in map(parse_detection, objs) if d is not None]
+            if not detections:
+                continue
+            kept.append((key, p))
+            for name, score in detections:
+                class_ids.append(class_of.setdefault(name, len(class_of)))
+                scores.append(score)
+                owner.append(key)
+        if len(class_of) > MAX_CLASSES:
+            raise ValueError(
+                f"{len(class_of)} detection classes do not fit in uint8 class ids"
+            )
+
+        owner_arr = np.asarray(owner, dtype=np.int64)
+        order = np.argsort(owner_arr, kind="stable")
+        offsets = np.zeros(keyframe_store.size + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(owner_arr, minlength=keyframe_store.size))
+
+        prefix_table = sorted({p[0] for _, p in kept})
+        prefix_code = {prefix: i for i, prefix in enumerate(prefix_table)}
+        packed = KeyframeMetadataStore.pack(
+            [prefix_code[p[0]] for _, p in kept],
+            [p[1] for _, p in kept],
+            [p[2] for _, p in kept],
+            [p[3] for _, p in kept],
+        )
+        lookup_order = np.argsort(packed, kind="stable")
+
+        columns = {
+            "offsets": offsets,
+            "class_ids": np.asarray(class_ids, dtype=np.uint8)[order],
+            "lookup_key": packed[lookup_order],
+            "lookup_id": np.array([key for key, _ in kept], dtype=np.int64)[
+                lookup_order
+            ],
+        }
+        scores_arr = np.asarray(scores, dtype=np.float32)
+        if np.isfinite(scores_arr).any():
+            columns["confidences"] = scores_arr[order].astype(np.float16)
+        return columns, {"class_names": list(class_of), "prefix_table": prefix_table}
+
+    @staticmethod
+    def save(path: str, columns: dict[str, np.ndarray], meta: dict):
+        write_columns(path, columns, meta)
+
+    def objects_of(self, key: int) -> list[str]:
+        if not 0 <= key < self.size:
+            return []
+        lo, hi = int(self.offsets[key]), int(self.offsets[key + 1])
+        return [self.class_names[c] for c in self.class_ids[lo:hi].tolist()]
+
+    def detections_of(self, key: int) -> list[tuple[str, float]]:
+        """(class name, confidence) pairs; confidence is NaN without scores"""
+        objects = self.objects_of(key)
+        if self.confidences is None or not objects:
+            return [(name, float("nan")) for name in objects]
+        lo = int(self.offsets[key])
+        scores = self.confidences[lo : lo + len(objects)].astype(np.float32).tolist()
+        return list(zip(objects, scores))
+
+    def key_of(self, path: str) -> int:
+        """'L21/L21_V001/005.jpg' -> keyframe id, -1 if it has no detections"""
+        parsed = parse_detection_key(path)
+        if parsed is None or parsed[0] not in self._prefix_code or not len(self):
+            return -1
+        packed = int(
+            KeyframeMetadataStore.pack(
+                self._prefix_code[parsed[0]], parsed[1], parsed[2], parsed[3]
+            )
+        )
+        pos = int(np.searchsorted(self._lookup_key, packed))
+        if pos < len(self._lookup_key) and int(self._lookup_key[pos]) == packed:
+            return int(self._lookup_id[pos])
+        return -1
+
+    def get(self, path: str, default=None) -> list[str] | None:
+        """Same lookup as the detections.json dict: path -> class names"""
+        key = self.key_of(path)
+        if key < 0:
+            return default
+        return self.objects_of(key)
+
+    def object_index(self) -> ObjectIndex:
+        """Class -> sorted keyframe ids, straight from the CSR arrays"""
+        counts = np.diff(np.asarray(self.offsets))
+        rows = np.repeat(np.arange(self.size, dtype=np.int64), counts)
+        classes = np.asarray(self.class_ids, dtype=np.int64)
+        order = np.lexsort((rows, classes))
+        rows, classes = rows[order], classes[order]
+        # một keyframe có thể có nhiều box cùng class: giữ 1 lần
+        keep = np.ones(len(rows), dtype=bool)
+        keep[1:] = (rows[1:] != rows[:-1]) | (classes[1:] != classes[:-1])
+        rows, classes = rows[keep], classes[keep]
+
+        offsets = np.zeros(len(self.class_names) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(classes, minlength=len(self.class_names)))
+        return ObjectIndex(list(self.class_names), offsets, rows)
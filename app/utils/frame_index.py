@@ -0,0 +1,230 @@
+"""
+Keyframe id -> (n, pts_time, fps, frame_idx), packed from the per-video
+data/map-keyframes/Lxx_Vyyy.csv files into one memory-mapped table
+(see utils/columnar.py and migration/frame_index_migration.py).
+
+Lookups take whole result lists and are vectorized; rows the table does not
+know come back with frame_idx == -1 so callers can fall back to the CSVs.
+"""
+
+import os
+import sys
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../"))
+sys.path.insert(0, ROOT_DIR)
+
+import csv
+import re
+
+import numpy as np
+
+from utils.columnar import read_columns, write_columns
+
+
+_VIDEO_CODE_RE = re.compile(r"^([A-Za-z]+)(\d+)_V(\d+)$")
+
+
+def video_code(prefix: str, group_num: int, video_num: int) -> str:
+    return f"{prefix}{int(group_num):02d}_V{int(video_num):03d}"
+
+
+def parse_video_code(code: str) -> tuple[str, int, int] | None:
+    """'L21_V001' -> ('L', 21, 1)"""
+    match = _VIDEO_CODE_RE.match(code)
+    if match is None:
+        return None
+    return match.group(1), int(match.group(2)), int(match.group(3))
+
+
+def _read_map_csv(path: str) -> dict[int, tuple[float, float, int]]:
+    """n -> (pts_time, fps, frame_idx)"""
+    table = {}
+    if not os.path.exists(path):
+        return table
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            table[int(row["n"])] = (
+                float(row["pts_time"]),
+                float(row["fps"]),
+                int(float(row["frame_idx"])),
+            )
+    return table
+
+
+class FrameIndex:
+    def __init__(self, columns: dict[str, np.ndarray], meta: dict):
+        # cột theo keyframe id (row == id)
+        self.video_row = columns["video_row"]
+        self.n = columns["n"]
+        self.pts_time = columns["pts_time"]
+        self.fps = columns["fps"]
+        self.frame_idx = columns["frame_idx"]
+
+        # (video_row << 32 | n) đã sort, để tra ngược từ video_code + n ra id
+        self._lookup_key = columns["lookup_key"]
+        self._lookup_id = columns["lookup_id"]
+
+        self.prefix_table: list[str] = meta["prefix_table"]
+        self._video_row_of = {
+            (self.prefix_table[p], int(g), int(v)): row
+            for row, (p, g, v) in enumerate(
+                zip(
+                    columns["video_prefix"].tolist(),
+                    columns["video_group"].tolist(),
+                    columns["video_num"].tolist(),
+                )
+            )
+        }
+
+    def __len__(self) -> int:
+        return len(self.frame_idx)
+
+    @classmethod
+    def open(cls, path: str) -> "FrameIndex":
+        columns, meta = read_columns(path, mmap=True)
+        return cls(columns, meta)
+
+    @staticmethod
+    def build(
+        id2index: dict[str, str], map_dir: str, prefix: str = "L"
+    ) -> tuple[dict[str, np.ndarray], dict]:
+        """
+        id2index.json: {"<key>": "<group>/<video>/<keyframe_num>"}; keyframe_num
+        is the 'n' column of the video's map-keyframes CSV.
+        Returns (columns, meta) ready for utils.columnar.write_columns.
+        """
+        entries = sorted(
+            (int(k), *(int(x) for x in v.split("/"))) for k, v in id2index.items()
+        )
+        size = entries[-1][0] + 1 if entries else 0
+
+        video_row = np.full(size, -1, dtype=np.int32)
+        n = np.full(size, -1, dtype=np.int32)
+        pts_time = np.full(size, np.nan, dtype=np.float64)
+        fps = np.full(size, np.nan, dtype=np.float32)
+        frame_idx = np.full(size, -1, dtype=np.int64)
+
+        videos: dict[tuple[int, int], int] = {}
+        for _, group_num, video_num, _ in entries:
+            videos.setdefault((group_num, video_num), len(videos))
+
+        # gom theo video trước: id của một video không nhất thiết liền nhau,
+        # mỗi CSV chỉ đọc một lần và không dùng nhầm mapping của video khác
+        entries.sort(key=lambda e: (videos[(e[1], e[2])], e[0]))
+        mapping: dict[int, tuple[float, float, int]] = {}
+        current_row = -1
+        for key, group_num, video_num, keyframe_num in entries:
+            row = videos[(group_num, video_num)]
+            if row != current_row:
+                current_row = row
+                mapping = _read_map_csv(
+                    os.path.join(map_dir, f"{video_code(prefix, group_num, video_num)}.csv")
+                )
+            video_row[key] = row
+            n[key] = keyframe_num
+            if keyframe_num in mapping:
+                pts_time[key], fps[key], frame_idx[key] = mapping[keyframe_num]
+
+        present = np.flatnonzero(video_row >= 0)
+        lookup_key = (video_row[present].astype(np.int64) << 32) | n[present].astype(
+            np.int64
+        )
+        order = np.argsort(lookup_key, kind="stable")
+
+        video_keys = list(videos)
+        columns = {
+            "video_row": video_row,
+            "n": n,
+            "pts_time": pts_time,
+            "fps": fps,
+            "frame_idx": frame_idx,
+            "lookup_key": lookup_key[order],
+            "lookup_id": present[order].astype(np.int64),
+            "video_prefix": np.zeros(len(video_keys), dtype=np.uint8),
+            "video_group": np.array([g for g, _ in video_keys], dtype=np.int16),
+            "video_num": np.array([v for _, v in video_keys], dtype=np.int16),
+        }
+        return columns, {"prefix_table": [prefix]}
+
+    @staticmethod
+    def save(path: str, columns: dict[str, np.ndarray], meta: dict):
+        write_columns(path, columns, meta)
+
+    def _valid(self, ids: np.ndarray) -> np.ndarray:
+        return (ids >= 0) & (ids < len(self.frame_idx))
+
+    def frame_idx_of(self, ids) -> np.ndarray:
+        """frame_idx for each keyframe id, -1 when unknown"""
+        ids = np.asarray(ids, dtype=np.int64)
+        out = np.full(len(ids), -1, dtype=np.int64)
+        valid = self._valid(ids)
+        out[valid] = self.frame_idx[ids[valid]]
+        return out
+
+    def pts_time_of(self, ids) -> np.ndarray:
+        """pts_time (seconds) for each keyframe id, NaN when unknown"""
+        ids = np.asarray(ids, dtype=np.int64)
+        out = np.full(len(ids), np.nan, dtype=np.float64)
+        valid = self._valid(ids)
+        out[valid] = self.pts_time[ids[valid]]
+        return out
+
+    def time_window(
+        self, key: int, video_start: int, video_end: int, t_from: float, t_to: float
+    ) -> tuple[int, int] | None:
+        """
+        Ids after `key` inside [video_start, video_end] whose pts_time lies in
+        [t_from, t_to]; pts_time increases with the id inside a video.
+        Keyframes without a pts_time (NaN) are skipped when searching.
+        """
+        lo = max(key + 1, video_start)
+        if lo > video_end:
+            return None
+        times = np.asarray(self.pts_time[lo : video_end + 1])
+        # NaN phá thứ tự sort của searchsorted -> chỉ tìm trên các dòng có pts_time
+        timed = np.flatnonzero(~np.isnan(times))
+        times = times[timed]
+        first = int(np.searchsorted(times, t_from, side="left"))
+        last = int(np.searchsorted(times, t_to, side="right")) - 1
+        if first > last:
+            return None
+        return lo + int(timed[first]), lo + int(timed[last])
+
+    def keyframes_by_video(self) -> dict[str, np.ndarray]:
+        """'L21_V001' -> sorted keyframe ids of that video"""
+        rows = np.asarray(self.video_row)
+        ids = np.flatnonzero(rows >= 0)
+        ids = ids[np.argsort(rows[ids], kind="stable")]
+        if len(ids) == 0:
+            return {}
+        code_of = {row: video_code(*key) for key, row in self._video_row_of.items()}
+        bounds = np.flatnonzero(np.diff(rows[ids])) + 1
+        return {
+            code_of[int(rows[chunk[0]])]: chunk for chunk in np.split(ids, bounds)
+        }
+
+    def ids_of(self, video_codes: list[str], keyframe_nums: list[int]) -> np.ndarray:
+        """Keyframe ids for ('L21_V001', n) pairs, -1 when unknown"""
+        rows = np.array(
+            [
+                self._video_row_of.get(parse_video_code(code) or (), -1)
+                for code in video_codes
+            ],
+            dtype=np.int64,
+        )
+        nums = np.asarray(keyframe_nums, dtype=np.int64)
+        query = (rows << 32) | nums
+
+        pos = np.searchsorted(self._lookup_key, query)
+        pos = np.minimum(pos, max(len(self._lookup_key) - 1, 0))
+        out = np.full(len(query), -1, dtype=np.int64)
+        if len(self._lookup_key) == 0:
+            return out
+        found = (rows >= 0) & (self._lookup_key[pos] == query)
+        out[found] = self._lookup_id[pos[found]]
+        return out
+
+    def frame_idx_for(
+        self, video_codes: list[str], keyframe_nums: list[int]
+    ) -> np.ndarray:
+        return self.frame_idx_of(self.ids_of(video_codes, keyframe_nums))
@@ -0,0 +1,104 @@
+"""
+Group / video -> keyframe id range lookup.
+
+Keyframe ids are contiguous per video (data/id2index.py), so a group or a
+(group, video) pair maps to a few inclusive [start, end] ranges. The index is
+built once; afterwards turning a group/video selection into ranges costs
+O(number of selected groups/videos) instead of a scan over every keyframe.
+"""
+
+from collections import defaultdict
+
+import numpy as np
+
+
+Range = tuple[int, int]
+
+
+class IdRangeIndex:
+    def __init__(self, video_ranges: dict[tuple[int, int], list[Range]]):
+        """video_ranges: (group_num, video_num) -> inclusive id ranges"""
+        self.video_ranges = video_ranges
+
+        self.group_ranges: dict[int, list[Range]] = defaultdict(list)
+        self.video_num_ranges: dict[int, list[Range]] = defaultdict(list)
+        for (group_num, video_num), ranges in video_ranges.items():
+            self.group_ranges[group_num].extend(ranges)
+            self.video_num_ranges[video_num].extend(ranges)
+
+    def __len__(self) -> int:
+        return len(self.video_ranges)
+
+    @classmethod
+    def from_columns(
+        cls, keys: np.ndarray, group_num: np.ndarray, video_num: np.ndarray
+    ) -> "IdRangeIndex":
+        """Row-aligned columns; a new range starts wherever the key sequence
+        jumps or the (group, video) pair changes."""
+        keys = np.asarray(keys, dtype=np.int64)
+        if len(keys) == 0:
+            return cls({})
+
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        groups = np.asarray(group_num, dtype=np.int64)[order]
+        videos = np.asarray(video_num, dtype=np.int64)[order]
+
+        breaks = (
+            (np.diff(keys) != 1)
+            | (np.diff(groups) != 0)
+            | (np.diff(videos) != 0)
+        )
+        starts = np.concatenate(([0], np.flatnonzero(breaks) + 1))
+        ends = np.concatenate((starts[1:] - 1, [len(keys) - 1]))
+
+        video_ranges: dict[tuple[int, int], list[Range]] = defaultdict(list)
+        for s, e in zip(starts.tolist(), ends.tolist()):
+            video_ranges[(int(groups[s]), int(videos[s]))].append(
+                (int(keys[s]), int(keys[e]))
+            )
+        return cls(dict(video_ranges))
+
+    @classmethod
+    def from_id2index(cls, id2index: dict[str, str]) -> "IdRangeIndex":
+        """id2index.json: {"<key>": "<group>/<video>/<keyframe_num>"}"""
+        n = len(id2index)
+        if n == 0:
+            return cls({})
+        keys = np.fromiter((int(k) for k in id2index), dtype=np.int64, count=n)
+        parts = np.array(
+            [v.split("/")[:2] for v in id2index.values()], dtype=np.int64
+        ).reshape(n, 2)
+        return cls.from_columns(keys, parts[:, 0], parts[:, 1])
+
+    def range_of(self, group_num: int, video_num: int, key: int) -> Range | None:
+        """The range of (group, video) that contains `key`"""
+        for start, end in self.video_ranges.get((group_num, video_num), []):
+            if start <= key <= end:
+                return start, end
+        return None
+
+    def ranges_for(
+        self,
+        groups: list[int] | None = None,
+        videos: list[int] | None = None,
+    ) -> list[Range]:
+        """
+        Ranges of the selected groups and/or videos (video numbers repeat in
+        every group). Empty or None means "no constraint" for that field, so
+        passing neither returns every range.
+        """
+        if groups and videos:
+            return [
+                r
+                for g in set(groups)
+                for v in set(videos)
+                for r in self.video_ranges.get((g, v), [])
+            ]
+        if groups:
+            return [r for g in set(groups) for r in self.group_ranges.get(g, [])]
+        if videos:
+            return [
+                r for v in set(videos) for r in self.video_num_ranges.get(v, [])
+            ]
+        return [r for ranges in self.video_ranges.values() for r in ranges]
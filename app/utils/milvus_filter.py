@@ -0,0 +1,156 @@
+"""
+Build Milvus boolean filter expressions and partition names from group/video
+selections.
+
+These rely on the scalar fields (group_num, video_num, keyframe_num, prefix)
+and the per-group partitions created by migration/embedding_migration.py.
+"""
+
+import re
+from typing import Iterable
+
+
+_PARTITION_RE = re.compile(r"^([A-Za-z]+)(\d+)$")
+
+
+def partition_name(prefix: str, group_num: int) -> str:
+    """Tên partition của một group, vd ('L', 21) -> 'L21'"""
+    return f"{prefix}{int(group_num):02d}"
+
+
+def parse_partition_name(name: str) -> tuple[str, int] | None:
+    match = _PARTITION_RE.match(name)
+    if match is None:
+        return None
+    return match.group(1), int(match.group(2))
+
+
+def _int_list(values) -> str:
+    return "[" + ", ".join(str(int(v)) for v in sorted(set(values))) + "]"
+
+
+def combine_and(*exprs: str | None) -> str | None:
+    parts = [e for e in exprs if e]
+    if not parts:
+        return None
+    if len(parts) == 1:
+        return parts[0]
+    return " and ".join(f"({e})" for e in parts)
+
+
+def build_scalar_filter(
+    include_groups: list[int] | None = None,
+    include_videos: list[int] | None = None,
+    exclude_groups: list[int] | None = None,
+) -> str | None:
+    """
+    Empty lists mean "no constraint" for that field.
+    Example: include_groups=[21, 22], include_videos=[3]
+        -> "(group_num in [21, 22]) and (video_num in [3])"
+    """
+    return combine_and(
+        f"group_num in {_int_list(include_groups)}" if include_groups else None,
+        f"video_num in {_int_list(include_videos)}" if include_videos else None,
+        f"group_num not in {_int_list(exclude_groups)}" if exclude_groups else None,
+    )
+
+
+# ---- id interval filters -------------------------------------------------
+# Keyframe ids are contiguous per video (data/id2index.py), so any selection of
+# videos/groups/ranges collapses to a handful of [start, end] intervals.
+
+Interval = tuple[int, int | None]  # end=None nghĩa là không giới hạn trên
+
+
+def merge_intervals(ranges: Iterable[tuple[int, int]]) -> list[tuple[int, int]]:
+    """Sort and merge overlapping or adjacent inclusive ranges"""
+    merged: list[list[int]] = []
+    for start, end in sorted((int(a), int(b)) for a, b in ranges if a <= b):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(a, b) for a, b in merged]
+
+
+def complement_intervals(intervals: list[Interval]) -> list[Interval]:
+    """Complement over [0, +inf) of sorted, merged intervals"""
+    result: list[Interval] = []
+    cursor: int | None = 0
+    for start, end in intervals:
+        if cursor is not None and start > cursor:
+            result.append((cursor, start - 1))
+        cursor = None if end is None else end + 1
+    if cursor is not None:
+        result.append((cursor, None))
+    return result
+
+
+def _intersect(a: list[Interval], b: list[Interval]) -> list[Interval]:
+    result: list[Interval] = []
+    i = j = 0
+    inf = float("inf")
+    while i < len(a) and j < len(b):
+        start = max(a[i][0], b[j][0])
+        end_a = inf if a[i][1] is None else a[i][1]
+        end_b = inf if b[j][1] is None else b[j][1]
+        end = min(end_a, end_b)
+        if start <= end:
+            result.append((start, None if end == inf else int(end)))
+        if end_a < end_b:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+def render_intervals(intervals: list[Interval], field: str = "id") -> str:
+    """
+    [(3, 3), (5, 5), (10, 20), (40, None)]
+        -> "id in [3, 5] or (id >= 10 and id <= 20) or id >= 40"
+    """
+    singles = [start for start, end in intervals if end == start]
+    clauses = []
+    if singles:
+        clauses.append(f"{field} in {_int_list(singles)}")
+    for start, end in intervals:
+        if end == start:
+            continue
+        if end is None:
+            clauses.append(f"{field} >= {start}")
+        else:
+            clauses.append(f"({field} >= {start} and {field} <= {end})")
+    if not clauses:
+        # không id nào hợp lệ
+        return f"{field} < 0"
+    return " or ".join(clauses)
+
+
+def compile_id_filter(
+    include_ranges: Iterable[tuple[int, int]] | None = None,
+    exclude_ranges: Iterable[tuple[int, int]] | None = None,
+    field: str = "id",
+) -> str | None:
+    """
+    Compile inclusive id ranges into the shorter of an include expression
+    ("(id >= a and id <= b) or ...") and an exclude expression
+    ("not (...)" over the complement). None means no constraint.
+    """
+    if include_ranges is None and exclude_ranges is None:
+        return None
+
+    allowed: list[Interval] = [(0, None)]
+    if include_ranges is not None:
+        allowed = list(merge_intervals(include_ranges))
+    if exclude_ranges is not None:
+        excluded = merge_intervals(exclude_ranges)
+        if not excluded and include_ranges is None:
+            return None
+        allowed = _intersect(allowed, complement_intervals(excluded))
+
+    include_expr = render_intervals(allowed, field)
+    denied = complement_intervals(allowed)
+    if not denied:
+        return None
+    exclude_expr = f"not ({render_intervals(denied, field)})"
+    return include_expr if len(include_expr) <= len(exclude_expr) else exclude_expr
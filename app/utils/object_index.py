@@ -0,0 +1,179 @@
+"""
+Inverted index over the COCO detections: class name -> sorted keyframe ids.
+
+Built once from detections.json ("Lxx/Lxx_Vyyy/nnn.jpg" -> [class, ...]) and
+the keyframe metadata store, or from the CSR arrays of utils/detection_store.py.
+An object constraint becomes a union of posting lists, which can be handed to
+Milvus as an id filter so the vector search only sees keyframes that contain
+the object. Common classes are fragmented into many id runs, so their filter
+can be restricted to a few candidate videos to keep the expression bounded.
+"""
+
+import os
+import sys
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../"))
+sys.path.insert(0, ROOT_DIR)
+
+import re
+from typing import Iterable
+
+import numpy as np
+
+from repository.keyframe_store import KeyframeMetadataStore
+from utils.milvus_filter import compile_id_filter
+
+
+_DETECTION_KEY_RE = re.compile(r"^([A-Za-z]+)(\d+)/\1\2_V(\d+)/(\d+)\.\w+$")
+
+
+def detection_key(prefix: str, group_num: int, video_num: int, keyframe_num: int) -> str:
+    """('L', 21, 1, 5) -> 'L21/L21_V001/005.jpg'"""
+    return (
+        f"{prefix}{group_num:02d}/{prefix}{group_num:02d}_V{video_num:03d}/"
+        f"{keyframe_num:03d}.jpg"
+    )
+
+
+def parse_detection_key(key: str) -> tuple[str, int, int, int] | None:
+    """'L21/L21_V001/005.jpg' -> ('L', 21, 1, 5)"""
+    match = _DETECTION_KEY_RE.match(key)
+    if match is None:
+        return None
+    prefix, group, video, keyframe = match.groups()
+    return prefix, int(group), int(video), int(keyframe)
+
+
+def parse_detection(obj) -> tuple[str, float] | None:
+    """'person' | {"class"/"label"/"name": ..., "score"/"confidence": ...} | [name, score]"""
+    if isinstance(obj, str):
+        return obj.lower(), float("nan")
+    if isinstance(obj, dict):
+        name = obj.get("class") or obj.get("label") or obj.get("name")
+        score = obj.get("score", obj.get("confidence"))
+    elif isinstance(obj, (list, tuple)) and obj:
+        name, score = obj[0], (obj[1] if len(obj) > 1 else None)
+    else:
+        return None
+    if not name:
+        return None
+    return str(name).lower(), float("nan") if score is None else float(score)
+
+
+def id_runs(ids: np.ndarray) -> list[tuple[int, int]]:
+    """Sorted unique ids -> inclusive runs, e.g. [1, 2, 3, 7] -> [(1, 3), (7, 7)]"""
+    ids = np.asarray(ids, dtype=np.int64)
+    if len(ids) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(ids) != 1)
+    starts = ids[np.concatenate(([0], breaks + 1))]
+    ends = ids[np.concatenate((breaks, [len(ids) - 1]))]
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+class ObjectIndex:
+    def __init__(self, class_names: list[str], offsets: np.ndarray, ids: np.ndarray):
+        """
+        CSR posting lists: ids[offsets[c]:offsets[c + 1]] are the sorted
+        keyframe ids where class `class_names[c]` was detected.
+        """
+        self.class_names = class_names
+        self.offsets = offsets
+        self.ids = ids
+        self._class_of = {name: c for c, name in enumerate(class_names)}
+
+    def __len__(self) -> int:
+        return len(self.class_names)
+
+    @classmethod
+    def from_detections(
+        cls,
+        objects_data: dict[str, list[str]],
+        keyframe_store: KeyframeMetadataStore,
+    ) -> "ObjectIndex":
+        parsed = [
+            (parse_detection_key(key), objects) for key, objects in objects_data.items()
+        ]
+        parsed = [(p, objects) for p, objects in parsed if p is not None and objects]
+        keyframe_ids = keyframe_store.lookup_ids(
+            [p[0] for p, _ in parsed],
+            (p[1] for p, _ in parsed),
+            (p[2] for p, _ in parsed),
+            (p[3] for p, _ in parsed),
+        )
+
+        class_of: dict[str, int] = {}
+        pair_class: list[int] = []
+        pair_id: list[int] = []
+        for key, (_, objects) in zip(keyframe_ids.tolist(), parsed):
+            if key < 0:
+                continue
+            detections = (parse_detection(obj) for obj in objects)
+            for name in {d[0] for d in detections if d is not None}:
+                pair_class.append(class_of.setdefault(name, len(class_of)))
+                pair_id.append(key)
+
+        pair_class_arr = np.asarray(pair_class, dtype=np.int64)
+        pair_id_arr = np.asarray(pair_id, dtype=np.int64)
+        # sort theo (class, id) -> mỗi class là một đoạn id tăng dần
+        order = np.lexsort((pair_id_arr, pair_class_arr))
+        offsets = np.zeros(len(class_of) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(pair_class_arr, minlength=len(class_of)))
+        return cls(list(class_of), offsets, pair_id_arr[order])
+
+    def ids_of(self, class_name: str) -> np.ndarray:
+        c = self._class_of.get(class_name.lower())
+        if c is None:
+            return np.zeros(0, dtype=np.int64)
+        return self.ids[self.offsets[c] : self.offsets[c + 1]]
+
+    def ids_for(self, class_names: Iterable[str]) -> np.ndarray:
+        """Sorted ids of keyframes containing any of `class_names`"""
+        postings = [self.ids_of(name) for name in set(class_names)]
+        postings = [p for p in postings if len(p)]
+        if not postings:
+            return np.zeros(0, dtype=np.int64)
+        if len(postings) == 1:
+            return postings[0]
+        return np.unique(np.concatenate(postings))
+
+    def contains_any(self, keys: Iterable[int], class_names: Iterable[str]) -> np.ndarray:
+        """Mask over `keys`: keyframe has at least one of `class_names`"""
+        keys = np.asarray(list(keys), dtype=np.int64)
+        allowed = self.ids_for(class_names)
+        if len(allowed) == 0:
+            return np.zeros(len(keys), dtype=bool)
+        pos = np.searchsorted(allowed, keys).clip(0, len(allowed) - 1)
+        return allowed[pos] == keys
+
+    def filter_expr(
+        self,
+        class_names: Iterable[str],
+        within: list[tuple[int, int]] | None = None,
+        max_expr_len: int = 20000,
+    ) -> str | None:
+        """
+        Milvus id expression for keyframes containing any of `class_names`,
+        optionally only inside the inclusive id ranges `within` (e.g. candidate
+        videos). None when no keyframe matches or the expression would be too
+        long; callers then narrow `within` or filter the search results instead.
+        """
+        allowed = self.ids_for(class_names)
+        if within is not None and len(allowed):
+            parts = [
+                allowed[
+                    np.searchsorted(allowed, start, side="left") : np.searchsorted(
+                        allowed, end, side="right"
+                    )
+                ]
+                for start, end in within
+            ]
+            allowed = (
+                np.unique(np.concatenate(parts)) if parts else allowed[:0]
+            )
+        if len(allowed) == 0:
+            return None
+        expr = compile_id_filter(include_ranges=id_runs(allowed))
+        if expr is None or len(expr) > max_expr_len:
+            return None
+        return expr
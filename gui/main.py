@@ -1,4 +1,5 @@
 import os
+import sys
 import streamlit as st
 import requests
 import json
@@ -469,24 +470,61 @@ def load_mapping_for_video(map_dir: str, video_code: str) -> dict[int, int]:
     return mapping
 
 
+# Frame index gộp (data/frame_index.bin); không có thì đọc từng CSV như cũ
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+try:
+    from app.core.settings import AppSettings
+    from app.utils.frame_index import FrameIndex
+
+    FRAME_INDEX_PATH = AppSettings().FRAME_INDEX_PATH
+except Exception:
+    FrameIndex = None
+    FRAME_INDEX_PATH = None
+
+
+@st.cache_resource(show_spinner=False)
+def load_frame_index():
+    if FrameIndex is None or not FRAME_INDEX_PATH or not os.path.exists(FRAME_INDEX_PATH):
+        return None
+    try:
+        return FrameIndex.open(FRAME_INDEX_PATH)
+    except Exception:
+        return None
+
+
 # Build CSV content in memory (vì results hiển thị theo 'path' dạng Lxx/Lxx_Vyyy/nnn.jpg)
 def build_csv_bytes_from_results(results: list, map_dir: str) -> bytes:
     """
     rows: <video_code>, <frame_idx>
     video_code: "L21_V001" hoặc "K07_V008"
-    frame_idx: lookup từ map-keyframes/<video_code>.csv theo keyframe_num
+    frame_idx: lookup trong frame index (một lần cho cả danh sách), thiếu thì
+               đọc map-keyframes/<video_code>.csv theo keyframe_num
     """
-    rows = []
-    cache = {}  # cache mapping per video_code
+    parsed = []
     for item in results:
         rel_path = item.get("path", "")
         video_code, keyframe_num = parse_code_and_knum_from_path(rel_path)
         if not video_code or keyframe_num is None:
             continue
-        if video_code not in cache:
-            cache[video_code] = load_mapping_for_video(map_dir, video_code)
-        mp = cache[video_code]
-        frame_idx = mp.get(keyframe_num, -1)  # fallback -1 nếu không tìm thấy
+        parsed.append((video_code, keyframe_num))
+
+    frame_indices = [-1] * len(parsed)
+    frame_index = load_frame_index()
+    if frame_index is not None and parsed:
+        frame_indices = frame_index.frame_idx_for(
+            [code for code, _ in parsed], [num for _, num in parsed]
+        ).tolist()
+
+    rows = []
+    cache = {}  # cache mapping per video_code
+    for (video_code, keyframe_num), frame_idx in zip(parsed, frame_indices):
+        if frame_idx < 0:
+            if video_code not in cache:
+                cache[video_code] = load_mapping_for_video(map_dir, video_code)
+            frame_idx = cache[video_code].get(keyframe_num, -1)  # fallback -1
         rows.append((video_code, frame_idx))
 
     # Ghi CSV vào bytes
@@ -0,0 +1,240 @@
+import sys
+import os
+
+ROOT_FOLDER = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT_FOLDER)
+
+import json
+import argparse
+from functools import lru_cache
+
+import numpy as np
+import open_clip
+import torch
+from tqdm import tqdm
+
+from app.core.settings import AppSettings
+from app.utils.asr_embeddings import (
+    AsrChunk,
+    AsrChunkIndex,
+    AsrEmbeddingIndex,
+    TOKEN_BUDGET,
+    asr_video_key,
+    time_chunks,
+)
+from app.utils.frame_index import FrameIndex
+
+
+def load_text_encoder(model_name: str, pretrained: str = "openai"):
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    model, _, _ = open_clip.create_model_and_transforms(model_name, pretrained=pretrained)
+    model = model.to(device).eval()
+    tokenizer = open_clip.get_tokenizer(model_name)
+
+    def encode(texts: list[str]) -> np.ndarray:
+        with torch.no_grad():
+            feats = model.encode_text(tokenizer(texts).to(device))
+            feats = feats / feats.norm(dim=-1, keepdim=True).clamp(min=1e-12)
+        return feats.cpu().numpy().astype(np.float32)
+
+    return encode
+
+
+def load_token_counter(model_name: str):
+    """
+    word -> number of BPE tokens for the model's tokenizer, plus the token
+    budget of one chunk (context length minus the start/end tokens)
+    """
+    tokenizer = open_clip.get_tokenizer(model_name)
+    budget = getattr(tokenizer, "context_length", TOKEN_BUDGET + 2) - 2
+    encode = getattr(tokenizer, "encode", None)
+    if encode is None:  # tokenizer của HF hub
+        hf_tokenizer = tokenizer.tokenizer
+
+        def encode(text: str) -> list[int]:
+            return hf_tokenizer.encode(text, add_special_tokens=False)
+
+    # CLIP tách từ trước khi BPE nên số token của cả đoạn = tổng theo từng từ
+    @lru_cache(maxsize=200_000)
+    def count_tokens(word: str) -> int:
+        return max(1, len(encode(word)))
+
+    return count_tokens, budget
+
+
+def map_keyframes_to_chunks(
+    frame_index: FrameIndex,
+    video_keys: list[str],
+    chunk_video: np.ndarray,
+    chunk_start: np.ndarray,
+    chunk_end: np.ndarray,
+) -> np.ndarray:
+    """keyframe id -> chunk whose time centre is nearest its pts_time (-1 if none)"""
+    keyframe_chunk = np.full(len(frame_index.video_row), -1, dtype=np.int32)
+    row_of = {key: row for row, key in enumerate(video_keys)}
+    for code, ids in frame_index.keyframes_by_video().items():
+        row = row_of.get(code)
+        if row is None:
+            continue
+        chunk_ids = np.flatnonzero(chunk_video == row)
+        centres = (chunk_start[chunk_ids] + chunk_end[chunk_ids]) / 2
+        timed = np.isfinite(centres)
+        chunk_ids, centres = chunk_ids[timed], centres[timed]
+        times = np.asarray(frame_index.pts_time[ids], dtype=np.float64)
+        known = np.isfinite(times)
+        if len(chunk_ids) == 0 or not known.any():
+            continue
+        order = np.argsort(centres, kind="stable")
+        chunk_ids, centres = chunk_ids[order], centres[order]
+
+        # tâm chunk gần nhất: so sánh hai phía của vị trí chèn
+        pos = np.searchsorted(centres, times[known])
+        left = (pos - 1).clip(0, len(centres) - 1)
+        right = pos.clip(0, len(centres) - 1)
+        use_left = np.abs(times[known] - centres[left]) <= np.abs(
+            centres[right] - times[known]
+        )
+        keyframe_chunk[ids[known]] = np.where(
+            use_left, chunk_ids[left], chunk_ids[right]
+        )
+    return keyframe_chunk
+
+
+def build_asr_embeddings(
+    asr_path: str,
+    output_path: str,
+    model_name: str,
+    batch_size: int = 256,
+    max_tokens: int | None = None,
+    overlap: int = 10,
+    frame_index_path: str | None = None,
+    chunk_output_path: str | None = None,
+):
+    with open(asr_path, "r", encoding="utf-8") as f:
+        asr_data: dict = json.load(f)
+
+    frame_index = None
+    if frame_index_path and os.path.exists(frame_index_path):
+        frame_index = FrameIndex.open(frame_index_path)
+    elif chunk_output_path:
+        print(
+            f"Frame index not found at {frame_index_path}; "
+            "chunks will have no timestamps"
+        )
+    durations = video_durations(frame_index) if frame_index is not None else {}
+
+    count_tokens, budget = load_token_counter(model_name)
+    max_tokens = min(max_tokens or budget, budget)
+
+    video_keys: list[str] = []
+    chunks: list[AsrChunk] = []
+    owner: list[int] = []  # chunk -> row của video
+    for name, record in asr_data.items():
+        video_key = asr_video_key(name)
+        video_chunks = time_chunks(
+            record, durations.get(video_key), count_tokens, max_tokens, overlap
+        )
+        if not video_chunks:
+            continue
+        owner.extend([len(video_keys)] * len(video_chunks))
+        chunks.extend(video_chunks)
+        video_keys.append(video_key)
+
+    if not chunks:
+        print(f"No ASR text found in {asr_path}")
+        return
+
+    encode = load_text_encoder(model_name)
+    texts = [text for _, _, text in chunks]
+    chunk_embeddings = np.concatenate(
+        [
+            encode(texts[start : start + batch_size])
+            for start in tqdm(range(0, len(texts), batch_size), desc="Embedding ASR")
+        ]
+    )
+
+    # trung bình các chunk theo video rồi chuẩn hoá lại
+    owner_arr = np.asarray(owner, dtype=np.int64)
+    num_chunks = np.bincount(owner_arr, minlength=len(video_keys))
+    embeddings = np.zeros((len(video_keys), chunk_embeddings.shape[1]), dtype=np.float32)
+    np.add.at(embeddings, owner_arr, chunk_embeddings)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True).clip(min=1e-12)
+
+    AsrEmbeddingIndex.save(output_path, video_keys, embeddings, num_chunks, model_name)
+    print(
+        f"Saved ASR embeddings for {len(video_keys)} videos "
+        f"({len(chunks)} chunks) to {output_path}"
+    )
+
+    if not chunk_output_path:
+        return
+    if frame_index is None:
+        keyframe_chunk = np.zeros(0, dtype=np.int32)
+    else:
+        keyframe_chunk = map_keyframes_to_chunks(
+            frame_index,
+            video_keys,
+            owner_arr,
+            np.array([c[0] for c in chunks], dtype=np.float64),
+            np.array([c[1] for c in chunks], dtype=np.float64),
+        )
+    AsrChunkIndex.save(
+        chunk_output_path,
+        video_keys,
+        owner_arr,
+        chunks,
+        chunk_embeddings,
+        keyframe_chunk,
+        model_name,
+    )
+    print(
+        f"Saved {len(chunks)} ASR chunks "
+        f"({int((keyframe_chunk >= 0).sum())} keyframes mapped) to {chunk_output_path}"
+    )
+
+
+def video_durations(frame_index: FrameIndex) -> dict[str, float]:
+    """'L21_V001' -> last keyframe pts_time, used as the transcript's duration"""
+    durations = {}
+    for code, ids in frame_index.keyframes_by_video().items():
+        times = np.asarray(frame_index.pts_time[ids], dtype=np.float64)
+        if np.isfinite(times).any():
+            durations[code] = float(np.nanmax(times))
+    return durations
+
+
+if __name__ == "__main__":
+    setting = AppSettings()
+
+    parser = argparse.ArgumentParser(
+        description="Embed each video's ASR transcript once for the agent."
+    )
+    parser.add_argument("--asr_path", type=str, default=setting.ASR_PATH)
+    parser.add_argument("--output_path", type=str, default=setting.ASR_EMBEDDING_PATH)
+    parser.add_argument(
+        "--chunk_output_path", type=str, default=setting.ASR_CHUNK_INDEX_PATH
+    )
+    parser.add_argument(
+        "--frame_index_path", type=str, default=setting.FRAME_INDEX_PATH
+    )
+    parser.add_argument("--model_name", type=str, default=setting.MODEL_NAME)
+    parser.add_argument("--batch_size", type=int, default=256)
+    parser.add_argument(
+        "--max_tokens",
+        type=int,
+        default=None,
+        help="Tokens per chunk (default: the text encoder's context minus 2)",
+    )
+    parser.add_argument("--overlap", type=int, default=10, help="Words shared by chunks")
+    args = parser.parse_args()
+
+    build_asr_embeddings(
+        asr_path=args.asr_path,
+        output_path=args.output_path,
+        model_name=args.model_name,
+        batch_size=args.batch_size,
+        max_tokens=args.max_tokens,
+        overlap=args.overlap,
+        frame_index_path=args.frame_index_path,
+        chunk_output_path=args.chunk_output_path,
+    )
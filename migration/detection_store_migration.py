@@ -0,0 +1,50 @@
+import sys
+import os
+
+ROOT_FOLDER = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT_FOLDER)
+
+import json
+import argparse
+
+from app.core.settings import AppSettings
+from app.repository.keyframe_store import KeyframeMetadataStore
+from app.utils.detection_store import DetectionStore
+
+
+def build_detection_store(detections_path: str, id2index_path: str, output_path: str):
+    with open(detections_path, "r", encoding="utf-8") as f:
+        objects_data = json.load(f)
+
+    keyframe_store = KeyframeMetadataStore.from_id2index(id2index_path)
+    columns, meta = DetectionStore.build(objects_data, keyframe_store)
+    DetectionStore.save(output_path, columns, meta)
+
+    stored = len(columns["lookup_id"])
+    print(
+        f"Saved {len(columns['class_ids'])} detections for {stored} keyframes "
+        f"({len(meta['class_names'])} classes, "
+        f"{'with' if 'confidences' in columns else 'without'} confidences) "
+        f"to {output_path}"
+    )
+    if stored < len(objects_data):
+        print(
+            f"Warning: {len(objects_data) - stored} entries were empty or "
+            "not found in id2index"
+        )
+
+
+if __name__ == "__main__":
+    setting = AppSettings()
+
+    parser = argparse.ArgumentParser(
+        description="Convert detections.json into a memory-mapped CSR store."
+    )
+    parser.add_argument("--detections_path", type=str, default=setting.FRAME2OBJECT)
+    parser.add_argument("--id2index_path", type=str, default=setting.ID2INDEX_PATH)
+    parser.add_argument(
+        "--output_path", type=str, default=setting.DETECTION_STORE_PATH
+    )
+    args = parser.parse_args()
+
+    build_detection_store(args.detections_path, args.id2index_path, args.output_path)
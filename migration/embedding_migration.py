@@ -11,6 +11,7 @@ from pymilvus import (
 from typing import Optional
 from tqdm import tqdm
 import argparse
+import json
 
 import sys
 import os
@@ -19,7 +20,45 @@ ROOT_FOLDER = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 sys.path.insert(0, ROOT_FOLDER)
 
 
-from app.core.settings import KeyFrameIndexMilvusSetting
+from app.core.settings import KeyFrameIndexMilvusSetting, AppSettings
+from app.utils.milvus_filter import partition_name
+
+
+# Scalar fields lưu kèm mỗi vector để lọc bằng expression gọn (group_num in [...])
+SCALAR_FIELDS = ["group_num", "video_num", "keyframe_num", "prefix"]
+
+
+def load_keyframe_metadata(
+    id2index_path: str, num_vectors: int
+) -> dict[str, np.ndarray]:
+    """
+    Đọc id2index.json ({"id": "group/video/keyframe"}) thành các cột scalar,
+    sắp theo id 0..num_vectors-1.
+    """
+    with open(id2index_path, "r", encoding="utf-8") as f:
+        id2index = json.load(f)
+
+    columns: dict[str, list] = {name: [] for name in SCALAR_FIELDS}
+    for i in range(num_vectors):
+        value = id2index.get(str(i))
+        if value is None:
+            raise KeyError(f"Missing id {i} in {id2index_path}")
+        group, video, keyframe = value.split("/")
+        columns["group_num"].append(int(group))
+        columns["video_num"].append(int(video))
+        columns["keyframe_num"].append(int(keyframe))
+        columns["prefix"].append("L")
+    return {name: np.asarray(values) for name, values in columns.items()}
+
+
+def rows_by_partition(metadata: dict[str, np.ndarray]) -> dict[str, np.ndarray]:
+    """Một partition cho mỗi (prefix, group), vd 'L21' -> các id thuộc L21"""
+    partitions: dict[str, list[int]] = {}
+    for row, (prefix, group_num) in enumerate(
+        zip(metadata["prefix"].tolist(), metadata["group_num"].tolist())
+    ):
+        partitions.setdefault(partition_name(prefix, group_num), []).append(row)
+    return {name: np.asarray(rows) for name, rows in partitions.items()}
 
 
 class MilvusEmbeddingInjector:
@@ -57,7 +96,10 @@ class MilvusEmbeddingInjector:
         print(f"Connected to Milvus at {host}:{port}")
 
     def create_collection(
-        self, embedding_dim: int, index_params: Optional[dict] = None
+        self,
+        embedding_dim: int,
+        index_params: Optional[dict] = None,
+        with_metadata: bool = True,
     ):
         fields = [
             FieldSchema(
@@ -67,6 +109,13 @@ class MilvusEmbeddingInjector:
                 name="embedding", dtype=DataType.FLOAT_VECTOR, dim=embedding_dim
             ),
         ]
+        if with_metadata:
+            fields += [
+                FieldSchema(name="group_num", dtype=DataType.INT16),
+                FieldSchema(name="video_num", dtype=DataType.INT16),
+                FieldSchema(name="keyframe_num", dtype=DataType.INT32),
+                FieldSchema(name="prefix", dtype=DataType.VARCHAR, max_length=8),
+            ]
 
         schema = CollectionSchema(
             fields, f"Collection for {self.collection_name} embeddings"
@@ -86,12 +135,22 @@ class MilvusEmbeddingInjector:
         collection.create_index("embedding", index_params)
         print("Created index for embedding field")
 
+        if with_metadata:
+            for field_name in SCALAR_FIELDS:
+                collection.create_index(
+                    field_name,
+                    {"index_type": "INVERTED"},
+                    index_name=f"{field_name}_idx",
+                )
+            print(f"Created scalar indexes for {', '.join(SCALAR_FIELDS)}")
+
         return collection
 
     def inject_embeddings(
         self,
         embedding_file_path: str,
         batch_size: int = 10000,
+        id2index_path: Optional[str] = None,
     ):
         print(f"Loading embeddings from {embedding_file_path}")
         embeddings = torch.load(embedding_file_path, weights_only=False)
@@ -110,23 +169,50 @@ class MilvusEmbeddingInjector:
         num_vectors, embedding_dim = embeddings.shape
         print(f"Loaded {num_vectors} embeddings with dimension {embedding_dim}")
 
+        metadata = None
+        if id2index_path and os.path.exists(id2index_path):
+            metadata = load_keyframe_metadata(id2index_path, num_vectors)
+            print(f"Loaded scalar metadata from {id2index_path}")
+        else:
+            print(
+                f"No id2index file at {id2index_path}, creating collection without scalar metadata"
+            )
+
         if utility.has_collection(self.collection_name, using=self.alias):
             print(
                 f"Dropping existing collection '{self.collection_name}' before creation..."
             )
             utility.drop_collection(self.collection_name, using=self.alias)
 
-        collection = self.create_collection(embedding_dim)
+        collection = self.create_collection(
+            embedding_dim, with_metadata=metadata is not None
+        )
 
-        print(f"Inserting {num_vectors} embeddings in batches of {batch_size}")
+        if metadata is None:
+            partitions = {None: np.arange(num_vectors)}
+        else:
+            partitions = rows_by_partition(metadata)
+            for name in partitions:
+                collection.create_partition(name)
+            print(f"Created {len(partitions)} partitions: {', '.join(partitions)}")
 
-        for i in tqdm(range(0, num_vectors, batch_size), desc="Inserting batches"):
-            end_idx = min(i + batch_size, num_vectors)
-            batch_embeddings = embeddings[i:end_idx].tolist()
+        print(f"Inserting {num_vectors} embeddings in batches of {batch_size}")
 
-            batch_ids = list(range(i, end_idx))
-            entities = [batch_ids, batch_embeddings]
-            collection.insert(entities)
+        for name, rows in partitions.items():
+            for i in tqdm(
+                range(0, len(rows), batch_size),
+                desc=f"Inserting {name}" if name else "Inserting batches",
+            ):
+                batch_rows = rows[i : i + batch_size]
+                batch_embeddings = embeddings[batch_rows].tolist()
+
+                batch_ids = batch_rows.tolist()
+                entities = [batch_ids, batch_embeddings]
+                if metadata is not None:
+                    entities += [
+                        metadata[field][batch_rows].tolist() for field in SCALAR_FIELDS
+                    ]
+                collection.insert(entities, partition_name=name)
 
         collection.flush()
         print("Data flushed to disk")
@@ -150,7 +236,9 @@ class MilvusEmbeddingInjector:
 
 
 def inject_embeddings_simple(
-    embedding_file_path: str, setting: KeyFrameIndexMilvusSetting
+    embedding_file_path: str,
+    setting: KeyFrameIndexMilvusSetting,
+    id2index_path: Optional[str] = None,
 ):
     injector = MilvusEmbeddingInjector(
         setting=setting,
@@ -160,7 +248,9 @@ def inject_embeddings_simple(
     )
 
     injector.inject_embeddings(
-        embedding_file_path=embedding_file_path, batch_size=setting.BATCH_SIZE
+        embedding_file_path=embedding_file_path,
+        batch_size=setting.BATCH_SIZE,
+        id2index_path=id2index_path,
     )
     count = injector.get_collection_info()
     print(f"Successfully injected embeddings! Total entities: {count}")
@@ -170,7 +260,17 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(description="Migrate embedding to Milvus.")
     parser.add_argument("--file_path", type=str, help="Path to embedding pt.")
+    parser.add_argument(
+        "--id2index_path",
+        type=str,
+        default=AppSettings().ID2INDEX_PATH,
+        help="Path to id2index.json, used to fill the scalar metadata fields.",
+    )
     args = parser.parse_args()
 
     setting = KeyFrameIndexMilvusSetting()
-    inject_embeddings_simple(embedding_file_path=args.file_path, setting=setting)
+    inject_embeddings_simple(
+        embedding_file_path=args.file_path,
+        setting=setting,
+        id2index_path=args.id2index_path,
+    )
@@ -0,0 +1,42 @@
+import sys
+import os
+
+ROOT_FOLDER = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT_FOLDER)
+
+import json
+import argparse
+
+from app.core.settings import AppSettings
+from app.utils.frame_index import FrameIndex
+
+
+def build_frame_index(id2index_path: str, map_dir: str, output_path: str):
+    with open(id2index_path, "r", encoding="utf-8") as f:
+        id2index = json.load(f)
+
+    columns, meta = FrameIndex.build(id2index, map_dir)
+    FrameIndex.save(output_path, columns, meta)
+
+    frame_idx = columns["frame_idx"]
+    mapped = int((frame_idx >= 0).sum())
+    print(
+        f"Saved frame index for {len(id2index)} keyframes "
+        f"({len(columns['video_group'])} videos, {mapped} mapped) to {output_path}"
+    )
+    if mapped < len(id2index):
+        print(f"Warning: {len(id2index) - mapped} keyframes have no map-keyframes row")
+
+
+if __name__ == "__main__":
+    setting = AppSettings()
+
+    parser = argparse.ArgumentParser(
+        description="Pack data/map-keyframes/*.csv into one frame index table."
+    )
+    parser.add_argument("--id2index_path", type=str, default=setting.ID2INDEX_PATH)
+    parser.add_argument("--map_dir", type=str, default=setting.MAP_KEYFRAME_DIR)
+    parser.add_argument("--output_path", type=str, default=setting.FRAME_INDEX_PATH)
+    args = parser.parse_args()
+
+    build_frame_index(args.id2index_path, args.map_dir, args.output_path)